@@ -0,0 +1,65 @@
+import os
+from typing import List
+
+"""
+Helpers shared by the batch scripts.
+
+Heavy plotting/statistics dependencies are imported on first use through
+pyplot() and seaborn() so runs that write no figures do not pay for them.
+Keep this module free of imports beyond the standard library.
+"""
+
+
+# Hold channel analysed per clamp regime:
+# key -> (curve store column, SI unit, output unit, SI -> output scale, clamped quantity)
+HOLD_CHANNELS = {
+    'height': ('height (measured)', 'm', 'um', 1e6, 'force'),   # force clamp: height creeps
+    'force': ('force', 'N', 'nN', 1e9, 'height'),               # height clamp: force relaxes
+}
+UNIT_LABELS = {'um': 'µm', 'nN': 'nN'}
+
+
+def hold_value_column(channel: str, stat: str = 'mean') -> str:
+    """Column name in the per-component average CSVs, e.g. height_um_mean."""
+    return f'{channel}_{HOLD_CHANNELS[channel][2]}_{stat}'
+
+
+def hold_channel_of_column(column: str) -> str:
+    """HOLD_CHANNELS key for a curve store column (e.g. a trace store's channel)."""
+    for key, spec in HOLD_CHANNELS.items():
+        if spec[0] == column:
+            return key
+    raise ValueError(f'No hold channel for column {column!r}; expected one of {[s[0] for s in HOLD_CHANNELS.values()]}')
+
+
+def pyplot():
+    """matplotlib.pyplot with the non-interactive Agg backend unless MPLBACKEND says otherwise."""
+    import sys
+    import matplotlib
+
+    if 'matplotlib.pyplot' not in sys.modules and not os.environ.get('MPLBACKEND'):
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def seaborn():
+    pyplot()
+    import seaborn as sns
+    return sns
+
+
+def file_group_from_name(name: str) -> str:
+    s = name.lower()
+    cond = 'ctrl' if 'ctrl' in s else ('bleb' if 'bleb' in s else 'unknown')
+    dish = 'dish1' if 'dish1' in s else ('dish2' if 'dish2' in s else 'unknown')
+    return f'{cond}-{dish}'
+
+
+def find_avg_csvs(root: str) -> List[str]:
+    files: List[str] = []
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            if fn.endswith('_hold_avg_time.csv'):
+                files.append(os.path.join(dirpath, fn))
+    return sorted(files)
@@ -0,0 +1,78 @@
+import argparse
+import json
+import sys
+
+from run_config import STAGE_USES, STAGES, apply_overrides, configure_module, config_hash, load_config, resolve_stage, write_run_record
+
+"""
+Single entry point for the batch scripts.
+
+    python afm_run.py curves --config run.toml --set RESAMPLE_METHOD=log
+    python afm_run.py steepness --config run.toml --set TAIL_FRACTION=0.7
+    python afm_run.py group --config run.toml --print-config
+    python afm_run.py sweep --config run.toml --set "SWEEP={'TAIL_FRACTION': [0.6, 0.8], 'N_POINTS': [200], 'NORMALIZATION': ['none'], 'RESAMPLE_METHOD': ['linear']}"
+
+Each subcommand sets the config (and --set overrides) on the stage's module
+and calls its main(). See run_config.py for the config layout and output
+directory namespacing.
+"""
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog='afm_run', description='Run AFM viscoelasticity batch stages from a config file.')
+    sub = p.add_subparsers(dest='stage', required=True)
+    helps = {
+        'setpoint': 'setpoint-height colormap PNG per map (batch_setpoint_colormap.py)',
+        'curves': 'per-component hold averages from masked maps (masked_height_curves.py)',
+        'group': 'group averages of per-component curves (group_component_curves.py)',
+        'steepness': 'hold slopes, boxplots and p-values (component_hold_steepness_boxplot.py)',
+        'browse': 'interactive setpoint map / curve browser with precomputed previews (curve_browser.py)',
+        'merge': 'combine sharded curves partials into component and group outputs (shard_merge.py)',
+        'sweep': 'steepness robustness over a grid of settings, maps decoded once (parameter_sweep.py)',
+        'elasticity': 'Hertz Young\'s modulus and fit-quality maps from approach curves (elasticity_map.py)',
+        'relaxation': 'height-clamp force relaxation metrics with optional passive subtraction (hold_relaxation.py)',
+        'filter': 'smooth whole maps into <column>_filtered columns of the cached curve stores (map_filtering.py)',
+    }
+    for stage in STAGES:
+        sp = sub.add_parser(stage, help=helps.get(stage))
+        sp.add_argument('-c', '--config', help='TOML or YAML config file')
+        sp.add_argument('-s', '--set', dest='overrides', action='append', default=[], metavar='[SECTION.]KEY=VALUE',
+                        help='override a setting (repeatable); bare keys apply to this stage')
+        sp.add_argument('--no-namespace', action='store_true',
+                        help='write to the configured directories as-is instead of <dir>/cfg-<hash>')
+        sp.add_argument('--print-config', action='store_true', help='print resolved settings and exit')
+        if stage == 'curves':
+            sp.add_argument('--shard', metavar='i/N', help='process every N-th file starting at i and write partial results')
+    return p
+
+
+def run_stage(stage: str, params, cfg, namespace: bool = True) -> None:
+    # Settings of stages this one calls into (e.g. sweep uses the curves selection)
+    for used in STAGE_USES.get(stage, ()):
+        configure_module(used, resolve_stage(cfg, used, namespace=namespace))
+    mod = configure_module(stage, params)
+    mod.main()
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        overrides = list(args.overrides)
+        if getattr(args, 'shard', None):
+            overrides.append(f'SHARD={args.shard!r}')
+        cfg = apply_overrides(load_config(args.config), overrides, args.stage)
+        params = resolve_stage(cfg, args.stage, namespace=not args.no_namespace)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f'afm_run {args.stage}: {e}', file=sys.stderr)
+        return 2
+    if args.print_config:
+        print(json.dumps({'stage': args.stage, 'hash': config_hash(cfg, args.stage), 'params': params},
+                         indent=1, sort_keys=True, default=str))
+        return 0
+    write_run_record(params, args.stage, cfg)
+    run_stage(args.stage, params, cfg, namespace=not args.no_namespace)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
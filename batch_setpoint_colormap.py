@@ -2,10 +2,9 @@ import os
 from glob import glob
 
 import numpy as np
-import afmformats as af
 import pandas as pd
-import matplotlib.pyplot as plt
-from skimage import io as skio
+
+from afm_common import pyplot
 
 # Minimal batch script:
 # - Set 'folder' to the directory containing AFM map files
@@ -14,9 +13,15 @@ from skimage import io as skio
 
 folder = 'd:/temp/25-09-05 - AFM blebbi/'
 pattern = '*.jpk-force-map'
+# Output directory for PNGs (namespaced per config by afm_run.py; None = next to each
+# input file, which concurrent runs would share)
+out_dir = 'd:/temp/25-09-05 - AFM blebbi_setpoint'
 
 
 def process_file(path: str) -> None:
+    import afmformats as af
+    from skimage import io as skio
+
     try:
         group = af.AFMGroup(path)
     except Exception as e:
@@ -66,12 +71,14 @@ def process_file(path: str) -> None:
     norm = np.clip(norm, 0.0, 1.0)
     norm[~finite_mask] = 0.0
 
-    cmap = plt.get_cmap('afmhot')
+    cmap = pyplot().get_cmap('afmhot')
     rgba = cmap(norm)
     rgb_u8 = (rgba[..., :3] * 255.0).astype(np.uint8)
 
     base = os.path.splitext(os.path.basename(path))[0]
-    out_png = os.path.join(os.path.dirname(path), f"{base}_setpoint_height_afmhot.png")
+    png_dir = out_dir or os.path.dirname(path)
+    os.makedirs(png_dir, exist_ok=True)
+    out_png = os.path.join(png_dir, f"{base}_setpoint_height_afmhot.png")
     skio.imsave(out_png, rgb_u8)
     print(f"Saved {out_png}")
 
@@ -4,9 +4,9 @@ from itertools import combinations
 
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from scipy import stats
+
+from afm_common import HOLD_CHANNELS, UNIT_LABELS, hold_channel_of_column, pyplot, seaborn
+from hold_metrics import detect_hold_channel, load_component_averages, stack_curves, tail_slopes
 """Compute steepness from per-component averaged curves without CLI args."""
 
 # Directory with per-component AVERAGED CSVs generated by masked_height_curves.py
@@ -16,42 +16,94 @@ plots_dir = '/data/2025-09-05_group_plots'
 
 # Portion of the curve to use for slope fit: last 4/5 = 0.8
 TAIL_FRACTION = 0.8
+# Hold channel of the per-component averages ('height' or 'force', see masked_height_curves.py);
+# None = take it from the CSV columns
+HOLD_CHANNEL = None
 
 
-def file_group_from_name(name: str) -> str:
-    s = name.lower()
-    cond = 'ctrl' if 'ctrl' in s else ('bleb' if 'bleb' in s else 'unknown')
-    dish = 'dish1' if 'dish1' in s else ('dish2' if 'dish2' in s else 'unknown')
-    return f'{cond}-{dish}'
+def slope_column(channel: str) -> str:
+    """e.g. slope_um_per_s for height, slope_nN_per_s for force."""
+    return f'slope_{HOLD_CHANNELS[channel][2]}_per_s'
 
 
-def find_avg_csvs(root: str) -> List[str]:
-    files: List[str] = []
-    for dirpath, _, filenames in os.walk(root):
-        for fn in filenames:
-            fp = os.path.join(dirpath, fn)
-            if fn.endswith('_hold_avg_time.csv'):
-                files.append(fp)
-    return sorted(files)
+def per_curve_slopes(traces, frac: float = TAIL_FRACTION, **filters) -> pd.DataFrame:
+    """Tail slope (µm/s or nN/s) of each unaveraged hold trace in a HoldTraces store (hold_traces.py).
 
+    filters select a subset by metadata, e.g. group='ctrl-dish1' or component_id=[1, 2];
+    only the chunks holding the selected traces are decompressed.
+    """
+    channel = hold_channel_of_column(traces.info['channel'])
+    scale = HOLD_CHANNELS[channel][3]
+    idx = traces.select(**filters)
+    T, Y, lengths = stack_curves([(t, y * scale) for t, y in traces.read(idx)])
+    slopes = tail_slopes(T, Y, lengths, frac)
+    keep = np.isfinite(slopes)
+    out = traces.meta.iloc[idx[keep]].reset_index(drop=True)
+    out['trace'] = idx[keep]
+    out[slope_column(channel)] = slopes[keep]
+    return out
 
-def linear_slope_last_tail(x: np.ndarray, y: np.ndarray, frac: float = TAIL_FRACTION) -> float | None:
-    if x.size < 3 or y.size != x.size:
-        return None
-    start = int(np.floor((1.0 - frac) * x.size))
-    if start >= x.size - 1:
-        return None
-    x_tail = x[start:]
-    y_tail = y[start:]
-    # Remove NaNs
-    msk = np.isfinite(x_tail) & np.isfinite(y_tail)
-    x_tail = x_tail[msk]
-    y_tail = y_tail[msk]
-    if x_tail.size < 2:
+
+def _stat_suffix(value_col: str) -> str:
+    # slope_um_per_s -> um_per_s, so result keys read mean1_um_per_s etc.
+    return value_col[len('slope_'):] if value_col.startswith('slope_') else value_col
+
+
+def welch_pairwise(slopes_df: pd.DataFrame, value_col: str = 'slope_um_per_s') -> List[Dict]:
+    """Welch t-test between every pair of groups; one dict per pair."""
+    from scipy import stats
+
+    sfx = _stat_suffix(value_col)
+    groups_present = sorted(slopes_df['group'].dropna().unique().tolist())
+    results = []
+    for g1, g2 in combinations(groups_present, 2):
+        a = slopes_df.loc[slopes_df['group'] == g1, value_col].dropna().to_numpy()
+        b = slopes_df.loc[slopes_df['group'] == g2, value_col].dropna().to_numpy()
+        if a.size < 2 or b.size < 2:
+            continue
+        _t, p = stats.ttest_ind(a, b, equal_var=False)
+        results.append({
+            'group1': g1,
+            'group2': g2,
+            'n1': int(a.size),
+            'n2': int(b.size),
+            f'mean1_{sfx}': float(np.mean(a)),
+            f'mean2_{sfx}': float(np.mean(b)),
+            f'diff_mean_{sfx}': float(np.mean(a) - np.mean(b)),
+            'pvalue_welch': float(p),
+        })
+    return results
+
+
+def cond_from_group(g: str) -> str:
+    g = (g or '').lower()
+    if g.startswith('ctrl-') or g == 'ctrl':
+        return 'ctrl'
+    if g.startswith('bleb-') or g == 'bleb':
+        return 'bleb'
+    return 'unknown'
+
+
+def welch_ctrl_vs_bleb(slopes_df: pd.DataFrame, value_col: str = 'slope_um_per_s') -> Dict | None:
+    """Welch t-test ctrl vs bleb with both dishes pooled; None if either side has < 2 values."""
+    from scipy import stats
+
+    sfx = _stat_suffix(value_col)
+    cond = slopes_df['group'].map(cond_from_group)
+    a = slopes_df.loc[cond == 'ctrl', value_col].dropna().to_numpy()
+    b = slopes_df.loc[cond == 'bleb', value_col].dropna().to_numpy()
+    if a.size < 2 or b.size < 2:
         return None
-    # Fit y = a*x + b
-    a, _b = np.polyfit(x_tail, y_tail, 1)
-    return float(a)
+    _t, p = stats.ttest_ind(a, b, equal_var=False)
+    return {
+        'comparison': 'ctrl_vs_bleb_mixed',
+        'n_ctrl': int(a.size),
+        'n_bleb': int(b.size),
+        f'mean_ctrl_{sfx}': float(np.mean(a)),
+        f'mean_bleb_{sfx}': float(np.mean(b)),
+        f'diff_mean_{sfx}': float(np.mean(a) - np.mean(b)),
+        'pvalue_welch': float(p),
+    }
 
 
 def main():
@@ -59,56 +111,40 @@ def main():
     cd = curves_dir
     pdout = plots_dir
 
-    avg_csvs = find_avg_csvs(cd)
-    if not avg_csvs:
+    channel = HOLD_CHANNEL or detect_hold_channel(cd)
+    if channel is None:
         print(f'No per-component averaged CSVs found under {cd}')
         return
+    meta, T, Y, lengths = load_component_averages(cd, channel)
+    if meta.empty:
+        print(f'No per-component averaged {channel} CSVs found under {cd}')
+        return
 
-    rows: List[Dict] = []
-    for csv_path in avg_csvs:
-        try:
-            df = pd.read_csv(csv_path)
-        except Exception as e:
-            print(f'Skip {csv_path}: cannot read ({e})')
-            continue
-        req = {'file', 'time_s', 'height_um_mean'}
-        if not req.issubset(df.columns) or df.empty:
-            print(f'Skip {csv_path}: missing required columns {req - set(df.columns)}')
-            continue
-        base = str(df['file'].iloc[0])
-        group = file_group_from_name(base)
-        comp_id = int(df['component_id'].iloc[0]) if 'component_id' in df.columns else None
-
-        dfg = df.sort_values('time_s')
-        t = dfg['time_s'].to_numpy(dtype=float)
-        y = dfg['height_um_mean'].to_numpy(dtype=float)
-        slope = linear_slope_last_tail(t, y, frac=TAIL_FRACTION)
-        if slope is None or not np.isfinite(slope):
-            continue
-        rows.append({
-            'file': base,
-            'component_id': comp_id if comp_id is not None else np.nan,
-            'group': group,
-            'slope_um_per_s': float(slope),
-            'curve_duration_s': float(np.nanmax(t) - np.nanmin(t)) if t.size > 1 else np.nan,
-        })
-
-    if not rows:
+    # All components in one batch (hold_metrics.tail_slopes)
+    col = slope_column(channel)
+    unit = UNIT_LABELS[HOLD_CHANNELS[channel][2]]
+    slopes = tail_slopes(T, Y, lengths, TAIL_FRACTION)
+    keep = np.isfinite(slopes)
+    if not keep.any():
         print('No slopes computed; nothing to plot')
         return
 
-    slopes_df = pd.DataFrame(rows)
+    slopes_df = meta.loc[keep, ['file', 'component_id', 'group']].reset_index(drop=True)
+    slopes_df[col] = slopes[keep]
+    slopes_df['curve_duration_s'] = meta.loc[keep, 'curve_duration_s'].to_numpy()
     os.makedirs(pdout, exist_ok=True)
     out_csv = os.path.join(pdout, 'hold_steepness_from_avg_slopes_last80_per_s.csv')
     slopes_df.to_csv(out_csv, index=False)
     print(f'Saved: {out_csv}')
 
     # Boxplot per group (simple)
+    plt = pyplot()
+    sns = seaborn()
     plt.figure(figsize=(8, 4.2), dpi=150)
-    ax = sns.boxplot(data=slopes_df, x='group', y='slope_um_per_s')
-    sns.stripplot(data=slopes_df, x='group', y='slope_um_per_s', ax=ax, color='k', alpha=0.4, jitter=0.15)
-    ax.set_title('Hold steepness from average curves (last 4/5) — µm/s')
-    ax.set_ylabel('slope [µm/s]')
+    ax = sns.boxplot(data=slopes_df, x='group', y=col)
+    sns.stripplot(data=slopes_df, x='group', y=col, ax=ax, color='k', alpha=0.4, jitter=0.15)
+    ax.set_title(f'Hold {channel} steepness from average curves (last 4/5) — {unit}/s')
+    ax.set_ylabel(f'slope [{unit}/s]')
     ax.set_xlabel('group')
     plt.tight_layout()
     out_png = os.path.join(pdout, 'hold_steepness_from_avg_boxplot_last80_per_s.png')
@@ -117,65 +153,28 @@ def main():
     print(f'Saved: {out_png}')
 
     # Very simple pairwise p-values table (Welch t-test only)
-    from itertools import combinations
-    groups_present = sorted(slopes_df['group'].dropna().unique().tolist())
-    results = []
-    for g1, g2 in combinations(groups_present, 2):
-        a = slopes_df.loc[slopes_df['group'] == g1, 'slope_um_per_s'].dropna().to_numpy()
-        b = slopes_df.loc[slopes_df['group'] == g2, 'slope_um_per_s'].dropna().to_numpy()
-        if a.size < 2 or b.size < 2:
-            continue
-        _t, p = stats.ttest_ind(a, b, equal_var=False)
-        results.append({
-            'group1': g1,
-            'group2': g2,
-            'n1': int(a.size),
-            'n2': int(b.size),
-            'mean1_um_per_s': float(np.mean(a)),
-            'mean2_um_per_s': float(np.mean(b)),
-            'diff_mean_um_per_s': float(np.mean(a) - np.mean(b)),
-            'pvalue_welch': float(p),
-        })
-
+    results = welch_pairwise(slopes_df, value_col=col)
     if results:
         pairwise_csv = os.path.join(pdout, 'hold_steepness_from_avg_pvalues_pairwise_per_s.csv')
         pd.DataFrame(results).to_csv(pairwise_csv, index=False)
         print(f'Saved: {pairwise_csv}')
 
     # Mixed dishes: ctrl vs bleb only (aggregate both dishes)
-    def cond_from_group(g: str) -> str:
-        g = (g or '').lower()
-        if g.startswith('ctrl-') or g == 'ctrl':
-            return 'ctrl'
-        if g.startswith('bleb-') or g == 'bleb':
-            return 'bleb'
-        return 'unknown'
-
     slopes_df['cond'] = slopes_df['group'].map(cond_from_group)
     sub = slopes_df[slopes_df['cond'].isin(['ctrl', 'bleb'])]
-    a = sub.loc[sub['cond'] == 'ctrl', 'slope_um_per_s'].dropna().to_numpy()
-    b = sub.loc[sub['cond'] == 'bleb', 'slope_um_per_s'].dropna().to_numpy()
-    if a.size >= 2 and b.size >= 2:
-        _t, p = stats.ttest_ind(a, b, equal_var=False)
+    mixed = welch_ctrl_vs_bleb(slopes_df, value_col=col)
+    if mixed is not None:
         # Save simple one-row CSV
         mixed_csv = os.path.join(pdout, 'hold_steepness_from_avg_pvalues_ctrl_vs_bleb_mixed_per_s.csv')
-        pd.DataFrame([{
-            'comparison': 'ctrl_vs_bleb_mixed',
-            'n_ctrl': int(a.size),
-            'n_bleb': int(b.size),
-            'mean_ctrl_um_per_s': float(np.mean(a)),
-            'mean_bleb_um_per_s': float(np.mean(b)),
-            'diff_mean_um_per_s': float(np.mean(a) - np.mean(b)),
-            'pvalue_welch': float(p),
-        }]).to_csv(mixed_csv, index=False)
+        pd.DataFrame([mixed]).to_csv(mixed_csv, index=False)
         print(f'Saved: {mixed_csv}')
 
         # Simple two-box plot: ctrl vs bleb (mixed dishes)
         plt.figure(figsize=(6, 4), dpi=150)
-        ax = sns.boxplot(data=sub, x='cond', y='slope_um_per_s')
-        sns.stripplot(data=sub, x='cond', y='slope_um_per_s', ax=ax, color='k', alpha=0.4, jitter=0.15)
-        ax.set_title('Hold steepness from avg curves — ctrl vs bleb (mixed)')
-        ax.set_ylabel('slope [µm/s]')
+        ax = sns.boxplot(data=sub, x='cond', y=col)
+        sns.stripplot(data=sub, x='cond', y=col, ax=ax, color='k', alpha=0.4, jitter=0.15)
+        ax.set_title(f'Hold {channel} steepness from avg curves — ctrl vs bleb (mixed)')
+        ax.set_ylabel(f'slope [{unit}/s]')
         ax.set_xlabel('condition')
         plt.tight_layout()
         mixed_png = os.path.join(pdout, 'hold_steepness_from_avg_boxplot_ctrl_vs_bleb_mixed_last80_per_s.png')
@@ -0,0 +1,235 @@
+import os
+from typing import Dict
+
+import numpy as np
+
+from curve_store import CurveStore, cached_store_dir, channel_column, find_time_column, load_curve_store_cached, segment_runs
+
+"""
+Interactive map/curve browser.
+
+Left: setpoint-height image (last approach sample of height (measured), as in
+setpoint_height_img.py). Click a pixel to show that curve's segments on the
+right (USE_FILTERED shows the filter stage's '<channel>_filtered' columns).
+Curves are drawn from a precomputed preview index (min/max envelope of
+each segment in PREVIEW_BINS time bins, float32) stored next to the cached
+curve store; the full curve is read from the memory-mapped store only once the
+view is zoomed in below the preview resolution.
+"""
+
+# Minimal configuration
+file_name = '/data/2025-09-05/PC-3-2029-bleb-25-dish1-data-2025.09.05-10.47.17.093.jpk-force-map'
+# Curve store cache (see curve_store.load_curve_store_cached); the preview index lives in the store dir
+cache_dir = '/data/2025-09-05_stores'
+
+PREVIEW_CHANNELS = ('force', 'height (measured)')
+# Show the '<channel>_filtered' columns written by the filter stage (map_filtering.py) where present
+USE_FILTERED = False
+PREVIEW_BINS = 32
+N_SEGMENTS = 3
+SEG_NAMES = {0: 'approach', 1: 'hold', 2: 'retract'}
+# Switch to full-resolution data when fewer than this many preview bins are visible
+ZOOM_MIN_BINS = 8
+
+
+def display_channels(store: CurveStore, channels=PREVIEW_CHANNELS, filtered: bool | None = None):
+    """Store columns drawn for the preview channels (filtered where requested and available)."""
+    filtered = USE_FILTERED if filtered is None else filtered
+    return tuple(channel_column(store.columns, ch, filtered, required=False) for ch in channels)
+
+
+def build_preview_index(store: CurveStore, n_bins: int = PREVIEW_BINS, channels=PREVIEW_CHANNELS) -> Dict[str, np.ndarray]:
+    """Per-curve, per-segment min/max envelopes plus the setpoint image, in one pass.
+
+    Arrays: t_start/t_end (n_curves, N_SEGMENTS); <channel>_min/_max
+    (n_curves, N_SEGMENTS, n_bins); setpoint (n_y, n_x); curve_at (n_y, n_x),
+    the curve index per pixel (-1 = none).
+    """
+    n = store.n_curves
+    starts, ends = segment_runs(store)
+    ci = store.curve_index()
+    run_curve = ci[starts]
+    run_seg = np.asarray(store.columns['segment'][starts], dtype=int)
+    keep = (run_seg >= 0) & (run_seg < N_SEGMENTS)
+    starts, ends, run_curve, run_seg = starts[keep], ends[keep], run_curve[keep], run_seg[keep]
+    run_len = ends - starts
+
+    # Bin index of every sample inside its run; keys are nondecreasing along the flat arrays
+    run_id = np.repeat(np.arange(starts.size), run_len)
+    pos = np.arange(int(run_len.sum())) - np.repeat(np.cumsum(run_len) - run_len, run_len)
+    flat_idx = np.repeat(starts, run_len) + pos
+    b = (pos * n_bins) // np.repeat(run_len, run_len)
+    key = run_id * n_bins + b
+    first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    key_u = key[first]
+    slot_curve = run_curve[key_u // n_bins]
+    slot_seg = run_seg[key_u // n_bins]
+    slot_bin = key_u % n_bins
+
+    index: Dict[str, np.ndarray] = {}
+    for ch in channels:
+        if ch not in store.columns:
+            continue
+        y = np.asarray(store.columns[ch], dtype=float)[flat_idx]
+        lo = np.full((n, N_SEGMENTS, n_bins), np.nan, dtype=np.float32)
+        hi = np.full((n, N_SEGMENTS, n_bins), np.nan, dtype=np.float32)
+        lo[slot_curve, slot_seg, slot_bin] = np.minimum.reduceat(y, first)
+        hi[slot_curve, slot_seg, slot_bin] = np.maximum.reduceat(y, first)
+        # Runs shorter than n_bins leave gaps; carry the previous bin forward
+        for arr in (lo, hi):
+            for k in range(1, n_bins):
+                gap = np.isnan(arr[:, :, k])
+                arr[:, :, k][gap] = arr[:, :, k - 1][gap]
+        index[f'{ch}_min'] = lo
+        index[f'{ch}_max'] = hi
+
+    t_col = find_time_column(store.columns)
+    t_start = np.full((n, N_SEGMENTS), np.nan)
+    t_end = np.full((n, N_SEGMENTS), np.nan)
+    if t_col is not None:
+        t = store.columns[t_col]
+        t_start[run_curve, run_seg] = t[starts]
+        t_end[run_curve, run_seg] = t[ends - 1]
+    index['t_start'] = t_start
+    index['t_end'] = t_end
+
+    # Setpoint height: last approach sample of each curve
+    setpoint = np.full((store.n_y, store.n_x), np.nan)
+    curve_at = np.full((store.n_y, store.n_x), -1, dtype=np.int64)
+    gx, gy = store.grid_x, store.grid_y
+    ok = (gx >= 0) & (gx < store.n_x) & (gy >= 0) & (gy < store.n_y)
+    curve_at[gy[ok], gx[ok]] = np.flatnonzero(ok)
+    appr = run_seg == 0
+    if 'height (measured)' in store.columns and np.any(appr):
+        sp = np.full(n, np.nan)
+        sp[run_curve[appr]] = store.columns['height (measured)'][ends[appr] - 1]
+        setpoint[gy[ok], gx[ok]] = sp[ok]
+    index['setpoint'] = setpoint
+    index['curve_at'] = curve_at
+    index['n_bins'] = np.asarray(n_bins)
+    return index
+
+
+def preview_path(store_dir: str) -> str:
+    return os.path.join(store_dir, 'preview.npz')
+
+
+def load_or_build_preview(store: CurveStore, store_dir: str, channels=PREVIEW_CHANNELS) -> Dict[str, np.ndarray]:
+    path = preview_path(store_dir)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(os.path.join(store_dir, 'store.json')):
+        with np.load(path) as z:
+            index = {k: z[k] for k in z.files}
+        # Rebuild when another set of channels (e.g. filtered) is requested
+        if all(f'{ch}_min' in index for ch in channels if ch in store.columns):
+            return index
+    index = build_preview_index(store, channels=channels)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as fh:
+        np.savez_compressed(fh, **index)
+    os.replace(tmp, path)
+    return index
+
+
+class CurveBrowser:
+    """Matplotlib window: setpoint image on the left, clicked curve on the right."""
+
+    def __init__(self, store: CurveStore, index: Dict[str, np.ndarray], title: str = '', channels=PREVIEW_CHANNELS):
+        import matplotlib.pyplot as plt
+
+        self.store = store
+        self.index = index
+        self.channels = [ch for ch in channels if f'{ch}_min' in index]
+        self.curve = -1
+        self.t_col = find_time_column(store.columns)
+
+        self.fig = plt.figure(figsize=(12, 5))
+        gs = self.fig.add_gridspec(len(self.channels), 2, width_ratios=(1, 1.4))
+        self.ax_img = self.fig.add_subplot(gs[:, 0])
+        self.ax_ch = []
+        for k in range(len(self.channels)):
+            sharex = self.ax_ch[0] if self.ax_ch else None
+            self.ax_ch.append(self.fig.add_subplot(gs[k, 1], sharex=sharex))
+        img = index['setpoint']
+        finite = np.isfinite(img)
+        vmin, vmax = (float(np.nanmin(img)), float(np.nanmax(img))) if np.any(finite) else (0.0, 1.0)
+        im = self.ax_img.imshow(img, origin='lower', cmap='afmhot', vmin=vmin, vmax=vmax, interpolation='nearest')
+        self.fig.colorbar(im, ax=self.ax_img, label='setpoint height (height measured)')
+        self.ax_img.set_title(title or 'Setpoint height (approach)', fontsize=8)
+        self.ax_img.set_xlabel('x index')
+        self.ax_img.set_ylabel('y index')
+        (self.marker,) = self.ax_img.plot([], [], 's', mfc='none', mec='c', ms=8)
+        self.fig.canvas.mpl_connect('button_press_event', self.on_click)
+        self.fig.tight_layout()
+
+    def on_click(self, event) -> None:
+        if event.inaxes is not self.ax_img or event.xdata is None:
+            return
+        gx, gy = int(round(event.xdata)), int(round(event.ydata))
+        curve_at = self.index['curve_at']
+        if not (0 <= gy < curve_at.shape[0] and 0 <= gx < curve_at.shape[1]) or curve_at[gy, gx] < 0:
+            return
+        self.curve = int(curve_at[gy, gx])
+        self.marker.set_data([gx], [gy])
+        self.draw_preview()
+
+    def draw_preview(self) -> None:
+        i = self.curve
+        n_bins = int(self.index['n_bins'])
+        for ax, ch in zip(self.ax_ch, self.channels):
+            ax.clear()
+            for s in range(N_SEGMENTS):
+                t0, t1 = self.index['t_start'][i, s], self.index['t_end'][i, s]
+                if not (np.isfinite(t0) and np.isfinite(t1)):
+                    continue
+                tb = np.linspace(t0, t1, n_bins)
+                ax.fill_between(tb, self.index[f'{ch}_min'][i, s], self.index[f'{ch}_max'][i, s],
+                                color=f'C{s}', alpha=0.6, linewidth=0, step='mid', label=SEG_NAMES.get(s, str(s)))
+            ax.set_ylabel(ch)
+        if self.ax_ch:
+            self.ax_ch[0].set_title(f'curve {i} (x={self.store.grid_x[i]}, y={self.store.grid_y[i]}) — preview', fontsize=8)
+            self.ax_ch[0].legend(loc='best', fontsize=7)
+            self.ax_ch[-1].set_xlabel('time (s)')
+            # ax.clear() drops axis callbacks, so (re)connect after drawing
+            self.ax_ch[0].callbacks.connect('xlim_changed', self.on_xlim)
+        self.fig.canvas.draw_idle()
+
+    def on_xlim(self, ax) -> None:
+        if self.curve < 0 or self.t_col is None:
+            return
+        lo, hi = ax.get_xlim()
+        i = self.curve
+        n_bins = int(self.index['n_bins'])
+        seg_len = self.index['t_end'][i] - self.index['t_start'][i]
+        bin_width = np.nanmin(seg_len) / n_bins if np.any(np.isfinite(seg_len)) else np.inf
+        if (hi - lo) > ZOOM_MIN_BINS * bin_width:
+            return
+        # Zoomed in past the preview resolution: read only the visible part of this curve
+        c = self.store.curve(i, [self.t_col] + self.channels)
+        t = np.asarray(c[self.t_col])
+        a, b = np.searchsorted(t, [lo, hi])
+        a, b = max(0, a - 1), min(t.size, b + 1)
+        for axc, ch in zip(self.ax_ch, self.channels):
+            for line in [ln for ln in axc.lines if ln.get_gid() == 'full']:
+                line.remove()
+            axc.plot(t[a:b], np.asarray(c[ch][a:b]), color='k', lw=0.6, gid='full')
+        self.fig.canvas.draw_idle()
+
+
+def main():
+    import matplotlib.pyplot as plt
+
+    if not cache_dir:
+        print('Set cache_dir: the browser keeps its preview index next to the cached curve store')
+        return None
+    store = load_curve_store_cached(file_name, cache_dir)
+    base = os.path.splitext(os.path.basename(file_name))[0]
+    store_dir = cached_store_dir(file_name, cache_dir)
+    channels = display_channels(store)
+    index = load_or_build_preview(store, store_dir, channels=channels)
+    browser = CurveBrowser(store, index, title=base, channels=channels)
+    plt.show()
+    return browser
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from afm_common import pyplot
+from curve_store import CurveStore, channel_column, find_time_column, segment_runs
+
+"""
+Clamp-quality QC for every curve of a force map, computed in one vectorized
+pass over the curve store.
+
+Per curve: total and hold sample counts, hold duration, clamp stability
+during hold (force CV under force clamp, piezo height std under height clamp) and
+segment-order sanity (approach -> hold -> retract, each exactly once).
+Curves outside the thresholds are flagged with a reason and excluded from
+component averages, so one map with short holds no longer shrinks the common
+time grid.
+"""
+
+HOLD_SEGMENT = 1
+EXPECTED_SEGMENTS = (0, 1, 2)
+
+# Defaults; flag_curves overlays the thresholds it is given (masked_height_curves.QC_THRESHOLDS)
+QC_THRESHOLDS = {
+    'min_hold_samples': 10,
+    'min_hold_duration_s': 0.0,
+    # Reject holds shorter than this fraction of the map's median hold duration
+    'min_hold_duration_rel': 0.9,
+    # Force-clamp quality: std/|mean| of force during hold
+    'max_hold_force_cv': 0.1,
+    # Height-clamp quality: std of the clamped height (piezo) during hold, in m; measured
+    # height moves by dF/k as the force relaxes, so it is only used without a piezo column
+    'max_hold_piezo_std_m': 50e-9,
+    'require_segment_order': True,
+}
+
+# QC map codes
+QC_OK = 0
+QC_REJECTED = 1
+QC_UNSELECTED = 2
+
+
+def compute_curve_qc(store: CurveStore, filtered: bool = False) -> pd.DataFrame:
+    """One row per curve with QC metrics (no thresholds applied).
+
+    filtered: measure clamp stability on the '<column>_filtered' channels
+    (map_filtering.py) where the store has them.
+    """
+    n = store.n_curves
+    ci = store.curve_index()
+    seg = store.columns['segment']
+    t_col = find_time_column(store.columns)
+
+    hold = seg == HOLD_SEGMENT
+    ci_h = ci[hold]
+    hold_n = np.bincount(ci_h, minlength=n)
+
+    # Hold duration: last minus first hold time per curve (hold samples are sorted by curve)
+    hold_duration = np.full(n, np.nan)
+    if t_col is not None and ci_h.size:
+        t_h = np.asarray(store.columns[t_col], dtype=float)[hold]
+        present = np.flatnonzero(hold_n)
+        first = np.concatenate(([0], np.cumsum(hold_n[present])[:-1]))
+        t_max = np.maximum.reduceat(t_h, first)
+        t_min = np.minimum.reduceat(t_h, first)
+        hold_duration[present] = t_max - t_min
+
+    def hold_mean_std(col: str) -> Tuple[np.ndarray, np.ndarray]:
+        if col not in store.columns or not ci_h.size:
+            return np.full(n, np.nan), np.full(n, np.nan)
+        v = np.asarray(store.columns[col], dtype=float)[hold]
+        # Shift by the map mean so large absolute heights do not cancel in s2 - s1^2
+        shift = v.mean()
+        s1 = np.bincount(ci_h, weights=v - shift, minlength=n)
+        s2 = np.bincount(ci_h, weights=(v - shift) ** 2, minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s1 / hold_n
+            std = np.sqrt(np.maximum(s2 / hold_n - mean * mean, 0.0))
+        return mean + shift, std
+
+    f_mean, f_std = hold_mean_std(channel_column(store.columns, 'force', filtered, required=False))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        hold_force_cv = f_std / np.abs(f_mean)
+    piezo = 'height (piezo)' if 'height (piezo)' in store.columns else 'height (measured)'
+    _h_mean, hold_piezo_std = hold_mean_std(channel_column(store.columns, piezo, filtered, required=False))
+
+    # Segment order: runs per curve must be exactly EXPECTED_SEGMENTS in order
+    starts, _ends = segment_runs(store)
+    run_curve = ci[starts]
+    run_seg = np.asarray(seg[starts], dtype=int)
+    n_runs = np.bincount(run_curve, minlength=n)
+    order_ok = n_runs == len(EXPECTED_SEGMENTS)
+    if starts.size:
+        first_run = np.concatenate(([0], np.cumsum(n_runs)[:-1]))
+        pos = np.arange(starts.size) - np.repeat(first_run, n_runs)
+        expected = np.asarray(EXPECTED_SEGMENTS)
+        mismatch = (pos >= expected.size) | (run_seg != expected[np.minimum(pos, expected.size - 1)])
+        order_ok &= np.bincount(run_curve, weights=mismatch, minlength=n) == 0
+
+    return pd.DataFrame({
+        'file': store.name,
+        'curve': np.arange(n),
+        'grid_x': store.grid_x,
+        'grid_y': store.grid_y,
+        'n_samples': np.diff(store.offsets),
+        'hold_n_samples': hold_n,
+        'hold_duration_s': hold_duration,
+        'hold_force_cv': hold_force_cv,
+        'hold_piezo_std_m': hold_piezo_std,
+        'segment_order_ok': order_ok,
+    })
+
+
+def flag_curves(qc: pd.DataFrame, thresholds: Dict | None = None, selected: np.ndarray | None = None,
+                clamp: str = 'force') -> pd.DataFrame:
+    """Add 'reject_reason' and 'rejected' columns.
+
+    `selected` (bool per curve) restricts the relative-duration reference to
+    curves that would actually be averaged (e.g. inside the mask). `clamp` is
+    the quantity held constant ('force' or 'height'); only its stability is
+    checked, since the other channel is expected to creep or relax.
+    """
+    thr = dict(QC_THRESHOLDS)
+    thr.update(thresholds or {})
+    qc = qc.copy()
+    dur = qc['hold_duration_s'].to_numpy(dtype=float)
+    ref = dur if selected is None else dur[np.asarray(selected, dtype=bool)]
+    ref = ref[np.isfinite(ref)]
+    median_dur = float(np.median(ref)) if ref.size else np.nan
+
+    checks = {
+        'few_hold_samples': qc['hold_n_samples'].to_numpy() < int(thr['min_hold_samples']),
+        'short_hold': ~(dur >= float(thr['min_hold_duration_s'])),
+        'short_hold_rel': np.isfinite(median_dur) & (dur < float(thr['min_hold_duration_rel']) * median_dur),
+    }
+    if clamp == 'force':
+        checks['force_cv'] = ~(qc['hold_force_cv'].to_numpy(dtype=float) <= float(thr['max_hold_force_cv']))
+    elif clamp == 'height':
+        checks['piezo_std'] = ~(qc['hold_piezo_std_m'].to_numpy(dtype=float) <= float(thr['max_hold_piezo_std_m']))
+    else:
+        raise ValueError(f"clamp must be 'force' or 'height', not {clamp!r}")
+    if thr['require_segment_order']:
+        checks['segment_order'] = ~qc['segment_order_ok'].to_numpy(dtype=bool)
+
+    reasons = np.full(len(qc), '', dtype=object)
+    for name, bad in checks.items():
+        reasons[bad] = np.where(reasons[bad] == '', name, reasons[bad] + ';' + name)
+    qc['reject_reason'] = reasons
+    qc['rejected'] = reasons != ''
+    return qc
+
+
+def qc_map(qc: pd.DataFrame, n_x: int, n_y: int, selected: np.ndarray | None = None) -> np.ndarray:
+    """(n_y, n_x) image of QC codes; NaN where no curve was measured."""
+    img = np.full((n_y, n_x), np.nan)
+    gx = qc['grid_x'].to_numpy()
+    gy = qc['grid_y'].to_numpy()
+    ok = (gx >= 0) & (gx < n_x) & (gy >= 0) & (gy < n_y)
+    code = np.where(qc['rejected'].to_numpy(), QC_REJECTED, QC_OK).astype(float)
+    if selected is not None:
+        code[~np.asarray(selected, dtype=bool)] = QC_UNSELECTED
+    img[gy[ok], gx[ok]] = code[ok]
+    return img
+
+
+def save_qc_outputs(qc: pd.DataFrame, store: CurveStore, out_dir: str, selected: np.ndarray | None = None) -> None:
+    """Write <name>_qc_report.csv (rejected curves) and <name>_qc_map.png."""
+    plt = pyplot()
+    from matplotlib.colors import ListedColormap
+
+    os.makedirs(out_dir, exist_ok=True)
+    base = store.name
+    report = qc[qc['rejected']]
+    if selected is not None:
+        report = report[np.asarray(selected, dtype=bool)[report['curve'].to_numpy()]]
+    csv_path = os.path.join(out_dir, f'{base}_qc_report.csv')
+    report.to_csv(csv_path, index=False)
+
+    img = qc_map(qc, store.n_x, store.n_y, selected=selected)
+    cmap = ListedColormap(['#2ca02c', '#d62728', '#c7c7c7'])
+    fig, ax = plt.subplots(figsize=(6, 5), dpi=150)
+    ax.imshow(img, origin='lower', cmap=cmap, vmin=-0.5, vmax=2.5, interpolation='nearest')
+    ax.set_title(f'{base} — QC (green ok, red rejected, grey unmasked)', fontsize=8)
+    ax.set_xlabel('x index')
+    ax.set_ylabel('y index')
+    fig.tight_layout()
+    png_path = os.path.join(out_dir, f'{base}_qc_map.png')
+    fig.savefig(png_path, dpi=150)
+    plt.close(fig)
+    print(f'Saved: {csv_path} ({len(report)} rejected) and {png_path}')
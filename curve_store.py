@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from glob import escape as glob_escape, glob
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+"""
+Concatenated curve store for a whole force map.
+
+Every column of every curve is laid end to end in one flat array
+(columns[name][offsets[i]:offsets[i + 1]] is curve i), so map-wide operations
+run as a few vectorized passes instead of a DataFrame per curve.
+
+On disk a store is a directory: one .npy per column (memory-mappable) plus
+store.json with the column file names and small per-curve arrays in store.npz.
+A complete store is built in a temporary directory and published with one
+rename, so readers never see columns and offsets from different writes.
+"""
+
+
+@dataclass
+class CurveStore:
+    columns: Dict[str, np.ndarray]
+    offsets: np.ndarray          # int64, length n_curves + 1
+    grid_x: np.ndarray           # int, per curve
+    grid_y: np.ndarray           # int, per curve
+    n_x: int
+    n_y: int
+    spring_constant: np.ndarray  # N/m, per curve
+    name: str = ''
+    metadata: Dict = field(default_factory=dict)
+
+    @property
+    def n_curves(self) -> int:
+        return int(self.offsets.size - 1)
+
+    def curve(self, i: int, cols: List[str] | None = None) -> Dict[str, np.ndarray]:
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        return {c: self.columns[c][a:b] for c in (cols or self.columns)}
+
+    def curve_index(self) -> np.ndarray:
+        """Curve index of every flat sample."""
+        return np.repeat(np.arange(self.n_curves), np.diff(self.offsets))
+
+
+TIME_CANDIDATES = ('time (s)', 'Time (s)', 'time_s', 'timestamp (s)', 'timestamp_s', 'time')
+
+
+FILTERED_SUFFIX = '_filtered'
+
+
+def channel_column(columns, column: str, filtered: bool = False, required: bool = True) -> str:
+    """Column to read for a channel: '<column>_filtered' (map_filtering.py) when filtered.
+
+    Without the filtered column, raises KeyError when required, else falls back
+    to the raw column.
+    """
+    if not filtered:
+        return column
+    name = f'{column}{FILTERED_SUFFIX}'
+    if name in columns:
+        return name
+    if required:
+        raise KeyError(f'{name!r} not in the curve store; run the filter stage (map_filtering.py) with the same cache_dir first')
+    return column
+
+
+def find_time_column(columns) -> str | None:
+    """Heuristically find a time column in seconds among column names."""
+    cols_lower = {c.lower(): c for c in columns}
+    for cand in TIME_CANDIDATES:
+        lc = cand.lower()
+        if lc in cols_lower:
+            return cols_lower[lc]
+    # fuzzy: any column containing 'time'
+    for c in columns:
+        if 'time' in c.lower():
+            return c
+    return None
+
+
+def _grid_xy(i: int, md: Dict, n_x: int) -> Tuple[int, int]:
+    gx = md.get('grid index x')
+    gy = md.get('grid index y')
+    if gx is None or gy is None:
+        gy = i // n_x
+        gx = i % n_x
+    return int(gx), int(gy)
+
+
+def load_curve_store(path: str) -> CurveStore:
+    """Decode a force map with afmformats into a CurveStore."""
+    import afmformats as af
+
+    group = af.AFMGroup(path)
+    md0 = group[0].metadata
+    n_x = int(md0['grid shape x'])
+    n_y = int(md0['grid shape y'])
+
+    names = list(group[0].columns)
+    chunks: Dict[str, List[np.ndarray]] = {c: [] for c in names}
+    lengths: List[int] = []
+    gxs: List[int] = []
+    gys: List[int] = []
+    ks: List[float] = []
+    for i, curve in enumerate(group):
+        md = getattr(curve, 'metadata', {}) or {}
+        n = None
+        for c in names:
+            arr = np.asarray(curve[c])
+            chunks[c].append(arr)
+            n = arr.size if n is None else n
+        lengths.append(int(n or 0))
+        gx, gy = _grid_xy(i, md, n_x)
+        gxs.append(gx)
+        gys.append(gy)
+        ks.append(float(md.get('spring constant', np.nan)))
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    columns = {c: np.concatenate(chunks[c]) for c in names}
+    if 'segment' in columns:
+        columns['segment'] = columns['segment'].astype(np.int8)
+    return CurveStore(
+        columns=columns,
+        offsets=offsets,
+        grid_x=np.asarray(gxs, dtype=np.int32),
+        grid_y=np.asarray(gys, dtype=np.int32),
+        n_x=n_x,
+        n_y=n_y,
+        spring_constant=np.asarray(ks, dtype=float),
+        name=os.path.splitext(os.path.basename(path))[0],
+        metadata={'source': os.path.abspath(path)},
+    )
+
+
+def _source_key(path: str) -> Dict:
+    st = os.stat(path)
+    return {'source': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def cached_store_dir(path: str, cache_dir: str) -> str:
+    """Store directory of a source file inside a cache directory.
+
+    Named after the file plus a hash of its absolute path, size and mtime, so
+    same-named sources and changed files never share a directory.
+    """
+    base = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha1(json.dumps(_source_key(path), sort_keys=True).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(cache_dir, f'{base}_{digest}_store')
+
+
+def _remove_stale_stores(path: str, cache_dir: str, keep: str) -> None:
+    """Drop stores of earlier versions of the same source file (best effort)."""
+    base = os.path.splitext(os.path.basename(path))[0]
+    source = os.path.abspath(path)
+    for d in glob(os.path.join(glob_escape(cache_dir), f'{glob_escape(base)}_*_store')):
+        if os.path.abspath(d) == os.path.abspath(keep):
+            continue
+        try:
+            with open(os.path.join(d, 'store.json'), encoding='utf-8') as fh:
+                stale = json.load(fh).get('metadata', {}).get('source') == source
+        except (OSError, ValueError):
+            continue
+        if stale:
+            # A reader may still map its columns (Windows); removed on a later decode
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def load_curve_store_cached(path: str, cache_dir: str | None) -> CurveStore:
+    """load_curve_store with an on-disk cache keyed by source path, size and mtime.
+
+    Each key has its own directory (cached_store_dir), published atomically by
+    save_curve_store, so concurrent runs sharing a cache directory at worst
+    decode the same file twice.
+    """
+    if not cache_dir:
+        return load_curve_store(path)
+    key = _source_key(path)
+    directory = cached_store_dir(path, cache_dir)
+    try:
+        store = open_curve_store(directory)
+        if all(store.metadata.get(k) == v for k, v in key.items()):
+            return store
+    except (OSError, ValueError, KeyError):
+        pass
+    store = load_curve_store(path)
+    store.metadata.update(key)
+    save_curve_store(store, directory)
+    _remove_stale_stores(path, cache_dir, keep=directory)
+    return store
+
+
+def segment_runs(store: CurveStore) -> Tuple[np.ndarray, np.ndarray]:
+    """(starts, ends) of flat runs with constant curve and segment.
+
+    Filters and per-segment reductions operate within these runs so nothing is
+    mixed across a segment or curve boundary.
+    """
+    n = int(store.offsets[-1])
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    brk = np.zeros(n, dtype=bool)
+    brk[0] = True
+    brk[store.offsets[1:-1]] = True
+    seg = store.columns.get('segment')
+    if seg is not None:
+        brk[1:] |= seg[1:] != seg[:-1]
+    starts = np.flatnonzero(brk)
+    ends = np.append(starts[1:], n)
+    return starts, ends
+
+
+def extract_segments(store: CurveStore, channel: str, curves, segment: int = 1) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """(time from segment start, channel) for one segment of each requested curve.
+
+    Curves whose segment has fewer than 2 samples or no time column yield
+    empty arrays, so the output stays aligned with `curves`.
+    """
+    t_col = find_time_column(store.columns)
+    seg = store.columns['segment']
+    out: List[Tuple[np.ndarray, np.ndarray]] = []
+    for i in curves:
+        a, b = int(store.offsets[i]), int(store.offsets[i + 1])
+        idxs = np.flatnonzero(seg[a:b] == segment)
+        if idxs.size < 2 or t_col is None:
+            out.append((np.zeros(0), np.zeros(0)))
+            continue
+        t = np.asarray(store.columns[t_col][a:b][idxs], dtype=float)
+        y = np.asarray(store.columns[channel][a:b][idxs], dtype=float)
+        out.append((t - float(t[0]), y))
+    return out
+
+
+def _column_file(name: str) -> str:
+    safe = ''.join(ch if ch.isalnum() else '_' for ch in name).strip('_')
+    return f'col_{safe}.npy'
+
+
+def _write_file(path: str, write) -> None:
+    tmp = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as fh:
+        write(fh)
+    os.replace(tmp, path)
+
+
+def save_curve_store(store: CurveStore, directory: str, only: List[str] | None = None) -> None:
+    """Write a store directory.
+
+    The whole store is written to a temporary sibling directory and renamed
+    into place (an existing store is swapped out first). only: add or replace
+    just these column files in an existing store (e.g. derived columns next to
+    memory-mapped raw ones); the manifest is then replaced last via os.replace.
+    """
+    files = {name: _column_file(name) for name in store.columns}
+    manifest = {'name': store.name, 'n_x': store.n_x, 'n_y': store.n_y,
+                'columns': files, 'metadata': store.metadata}
+
+    def write_manifest(fh):
+        fh.write(json.dumps(manifest, indent=1).encode('utf-8'))
+
+    if only is not None:
+        for name in only:
+            _write_file(os.path.join(directory, files[name]), lambda fh: np.save(fh, store.columns[name]))
+        _write_file(os.path.join(directory, 'store.json'), write_manifest)
+        return
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp = f'{directory}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, fn in files.items():
+        np.save(os.path.join(tmp, fn), store.columns[name])
+    np.savez(os.path.join(tmp, 'store.npz'), offsets=store.offsets, grid_x=store.grid_x, grid_y=store.grid_y,
+             spring_constant=store.spring_constant)
+    with open(os.path.join(tmp, 'store.json'), 'wb') as fh:
+        write_manifest(fh)
+    old = f'{directory}.{os.getpid()}.old'
+    try:
+        if os.path.exists(directory):
+            os.rename(directory, old)
+        os.rename(tmp, directory)
+    except OSError:
+        # Another writer published first, or the old store is still mapped (Windows): keep what is there
+        if not os.path.exists(directory) and os.path.exists(old):
+            os.rename(old, directory)
+        shutil.rmtree(tmp, ignore_errors=True)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def open_curve_store(directory: str, mmap: bool = True, cols: List[str] | None = None) -> CurveStore:
+    """Open a saved store; columns are memory-mapped unless mmap=False."""
+    with open(os.path.join(directory, 'store.json'), encoding='utf-8') as fh:
+        manifest = json.load(fh)
+    with np.load(os.path.join(directory, 'store.npz')) as z:
+        small = {k: z[k] for k in z.files}
+    columns = {}
+    for name, fn in manifest['columns'].items():
+        if cols is not None and name not in cols:
+            continue
+        columns[name] = np.load(os.path.join(directory, fn), mmap_mode='r' if mmap else None)
+    return CurveStore(
+        columns=columns,
+        offsets=small['offsets'],
+        grid_x=small['grid_x'],
+        grid_y=small['grid_y'],
+        n_x=int(manifest['n_x']),
+        n_y=int(manifest['n_y']),
+        spring_constant=small['spring_constant'],
+        name=manifest.get('name', ''),
+        metadata=manifest.get('metadata', {}),
+    )
@@ -0,0 +1,217 @@
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+from afm_common import pyplot
+from curve_store import CurveStore, load_curve_store_cached, segment_runs
+
+"""
+Young's modulus maps from the approach segment (spherical Hertz), fitted for
+all curves of a map at once.
+
+Per curve: baseline force from the first BASELINE_FRACTION of the approach,
+contact at the first sample above baseline + CONTACT_NSIGMA * noise,
+indentation delta = h_contact - height (measured) after contact (README).
+Spherical Hertz F = 4/3 * E / (1 - nu^2) * sqrt(R) * delta^(3/2) is linearized
+as F^(2/3) = K^(2/3) * (delta - delta0) and solved for every curve from
+per-curve sums (np.bincount); optional Gauss-Newton steps then refine K and the
+contact offset delta0 on the original F(delta), also batched.
+Outputs per map: CSV (one row per curve) and PNGs of E and fit R^2.
+"""
+
+# Minimal configuration
+folder = '/data/2025-09-05'
+pattern = '*.jpk-force-map'
+out_dir = '/data/2025-09-05_elasticity'
+# Decoded curve stores (see curve_store.load_curve_store_cached; None = no cache)
+cache_dir = None
+
+TIP_RADIUS_M = 5e-6
+POISSON_RATIO = 0.5
+BASELINE_FRACTION = 0.3
+CONTACT_NSIGMA = 3.0
+# Fit only up to this indentation (m); None = whole post-contact approach
+MAX_INDENTATION_M = None
+# Gauss-Newton refinement steps on F(delta) after the linearized fit (0 = off)
+REFINE_ITERATIONS = 5
+MIN_FIT_POINTS = 10
+
+APPROACH_SEGMENT = 0
+
+
+def _approach_samples(store: CurveStore):
+    """Flat indices of approach samples with their run (curve) id and position in the run."""
+    starts, ends = segment_runs(store)
+    seg = np.asarray(store.columns['segment'][starts], dtype=int)
+    keep = seg == APPROACH_SEGMENT
+    starts, ends = starts[keep], ends[keep]
+    curve = store.curve_index()[starts]
+    # One approach run per curve; a repeated approach keeps the first
+    _u, first = np.unique(curve, return_index=True)
+    starts, ends, curve = starts[first], ends[first], curve[first]
+    run_len = ends - starts
+    run_id = np.repeat(np.arange(starts.size), run_len)
+    pos = np.arange(int(run_len.sum())) - np.repeat(np.cumsum(run_len) - run_len, run_len)
+    flat_idx = np.repeat(starts, run_len) + pos
+    return curve, run_len, run_id, pos, flat_idx
+
+
+def fit_hertz_map(store: CurveStore, radius: float = TIP_RADIUS_M, poisson: float = POISSON_RATIO,
+                  refine_iterations: int = REFINE_ITERATIONS) -> pd.DataFrame:
+    """One row per curve: E_Pa, r2, contact height, fit point count (NaN where no fit)."""
+    n = store.n_curves
+    curve, run_len, run_id, pos, flat_idx = _approach_samples(store)
+    n_runs = curve.size
+    F = np.asarray(store.columns['force'], dtype=float)[flat_idx]
+    h = np.asarray(store.columns['height (measured)'], dtype=float)[flat_idx]
+
+    # Baseline and noise from the start of each approach
+    n_base = np.maximum((BASELINE_FRACTION * run_len).astype(np.int64), 2)
+    base = pos < n_base[run_id]
+    cnt = np.bincount(run_id[base], minlength=n_runs)
+    s1 = np.bincount(run_id[base], weights=F[base], minlength=n_runs)
+    s2 = np.bincount(run_id[base], weights=F[base] ** 2, minlength=n_runs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f0 = s1 / cnt
+        noise = np.sqrt(np.maximum(s2 / cnt - f0 ** 2, 0.0))
+
+    # Contact: first sample after the baseline window above threshold
+    above = (pos >= n_base[run_id]) & (F > (f0 + CONTACT_NSIGMA * noise)[run_id])
+    big = np.iinfo(np.int64).max
+    run_start = np.concatenate(([0], np.cumsum(run_len)[:-1]))
+    contact_pos = np.minimum.reduceat(np.where(above, pos, big), run_start) if n_runs else np.zeros(0, np.int64)
+    has_contact = contact_pos < big
+    contact_pos = np.where(has_contact, contact_pos, 0)
+    h_contact = h[run_start + contact_pos]
+
+    delta = h_contact[run_id] - h
+    Fc = F - f0[run_id]
+    fit = has_contact[run_id] & (pos >= contact_pos[run_id]) & (delta >= 0) & (Fc > 0)
+    if MAX_INDENTATION_M is not None:
+        fit &= delta <= MAX_INDENTATION_M
+    r = run_id[fit]
+    x = delta[fit]
+    y = Fc[fit]
+    m = np.bincount(r, minlength=n_runs).astype(float)
+
+    # Linearized fit y^(2/3) = a * x + b per run, from sums
+    z = np.cbrt(y) ** 2
+    Sx = np.bincount(r, weights=x, minlength=n_runs)
+    Sz = np.bincount(r, weights=z, minlength=n_runs)
+    Sxx = np.bincount(r, weights=x * x, minlength=n_runs)
+    Sxz = np.bincount(r, weights=x * z, minlength=n_runs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        den = m * Sxx - Sx * Sx
+        a = (m * Sxz - Sx * Sz) / den
+        b = (Sz - a * Sx) / m
+        K = np.where(a > 0, a, np.nan) ** 1.5
+        d0 = -b / a
+
+    # Gauss-Newton on F = K * (delta - d0)^(3/2), all runs at once
+    for _ in range(int(refine_iterations)):
+        u = np.maximum(x - d0[r], 0.0)
+        model = K[r] * u ** 1.5
+        res = y - model
+        jK = u ** 1.5
+        jd = -1.5 * K[r] * np.sqrt(u)
+        A11 = np.bincount(r, weights=jK * jK, minlength=n_runs)
+        A12 = np.bincount(r, weights=jK * jd, minlength=n_runs)
+        A22 = np.bincount(r, weights=jd * jd, minlength=n_runs)
+        g1 = np.bincount(r, weights=jK * res, minlength=n_runs)
+        g2 = np.bincount(r, weights=jd * res, minlength=n_runs)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            det = A11 * A22 - A12 * A12
+            dK = (A22 * g1 - A12 * g2) / det
+            dd = (A11 * g2 - A12 * g1) / det
+        ok = np.isfinite(dK) & np.isfinite(dd) & (K + dK > 0)
+        K = np.where(ok, K + dK, K)
+        d0 = np.where(ok, d0 + dd, d0)
+
+    # Fit quality on the original F(delta)
+    u = np.maximum(x - d0[r], 0.0)
+    res = y - K[r] * u ** 1.5
+    ss_res = np.bincount(r, weights=res * res, minlength=n_runs)
+    Sy = np.bincount(r, weights=y, minlength=n_runs)
+    Syy = np.bincount(r, weights=y * y, minlength=n_runs)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ss_tot = Syy - Sy * Sy / m
+        r2 = 1.0 - ss_res / ss_tot
+        E = 0.75 * K * (1.0 - poisson ** 2) / np.sqrt(radius)
+    bad = (m < MIN_FIT_POINTS) | ~np.isfinite(E) | (E <= 0)
+    E[bad] = np.nan
+    r2[bad] = np.nan
+
+    out = pd.DataFrame({
+        'file': store.name,
+        'curve': np.arange(n),
+        'grid_x': store.grid_x,
+        'grid_y': store.grid_y,
+    })
+    for col, vals in (('E_Pa', E), ('r2', r2), ('n_fit_points', m), ('contact_height_m', np.where(has_contact, h_contact, np.nan)),
+                      ('contact_offset_m', d0), ('baseline_force_N', f0)):
+        full = np.full(n, np.nan)
+        full[curve] = vals
+        out[col] = full
+    return out
+
+
+def map_image(df: pd.DataFrame, col: str, n_x: int, n_y: int) -> np.ndarray:
+    img = np.full((n_y, n_x), np.nan)
+    gx = df['grid_x'].to_numpy()
+    gy = df['grid_y'].to_numpy()
+    ok = (gx >= 0) & (gx < n_x) & (gy >= 0) & (gy < n_y)
+    img[gy[ok], gx[ok]] = df[col].to_numpy()[ok]
+    return img
+
+
+def save_map_png(img: np.ndarray, path: str, title: str, label: str, cmap: str = 'viridis', vmin=None, vmax=None) -> None:
+    plt = pyplot()
+    fig, ax = plt.subplots(figsize=(6, 5), dpi=150)
+    im = ax.imshow(img, origin='lower', cmap=cmap, vmin=vmin, vmax=vmax, interpolation='nearest')
+    fig.colorbar(im, ax=ax, label=label)
+    ax.set_title(title, fontsize=8)
+    ax.set_xlabel('x index')
+    ax.set_ylabel('y index')
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def process_file(path: str) -> pd.DataFrame | None:
+    base = os.path.splitext(os.path.basename(path))[0]
+    try:
+        store = load_curve_store_cached(path, cache_dir)
+    except Exception as e:
+        print(f'Skip {base}: cannot open ({e})')
+        return None
+
+    df = fit_hertz_map(store)
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, f'{base}_elasticity.csv')
+    df.to_csv(csv_path, index=False)
+
+    E_kPa = map_image(df, 'E_Pa', store.n_x, store.n_y) * 1e-3
+    finite = E_kPa[np.isfinite(E_kPa)]
+    vmax = float(np.percentile(finite, 98)) if finite.size else None
+    png_e = os.path.join(out_dir, f'{base}_elasticity_E_kPa.png')
+    save_map_png(E_kPa, png_e, f'{base} — Hertz E (R={TIP_RADIUS_M * 1e6:g} µm, ν={POISSON_RATIO:g})', 'E (kPa)', vmin=0.0, vmax=vmax)
+    png_r2 = os.path.join(out_dir, f'{base}_elasticity_r2.png')
+    save_map_png(map_image(df, 'r2', store.n_x, store.n_y), png_r2, f'{base} — Hertz fit R²', 'R²', cmap='magma', vmin=0.0, vmax=1.0)
+    n_ok = int(np.isfinite(df['E_Pa']).sum())
+    print(f'Saved: {csv_path}, {png_e} and {png_r2} ({n_ok}/{len(df)} curves fitted)')
+    return df
+
+
+def main():
+    files = sorted(glob(os.path.join(folder, pattern)))
+    if not files:
+        print(f'No files found in {folder} matching {pattern}')
+        return
+    for path in files:
+        process_file(path)
+
+
+if __name__ == '__main__':
+    main()
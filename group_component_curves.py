@@ -3,12 +3,26 @@ from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+
+from afm_common import HOLD_CHANNELS, UNIT_LABELS, pyplot
+from hold_metrics import detect_hold_channel, duration_gate, load_component_averages
+from hold_resampling import resample_curves
 
 # Input directory containing per-component averaged CSVs generated by masked_height_curves.py
 curves_dir = '/data/2025-09-05_curves'
 # Output directory for group plots
 plots_dir = '/data/2025-09-05_group_plots'
+# Resampling of per-component averages onto the group grid (see hold_resampling.py).
+# Inputs are already 200-point averages, so plain interpolation is the default here.
+RESAMPLE_METHOD = 'linear'
+# Points on the common group time grid
+N_POINTS = 200
+# Drop component averages shorter than this fraction of the median component duration
+# over the whole run (all maps), so one map with short holds cannot shrink the group grid
+MIN_DURATION_REL = 0.9
+# Hold channel of the per-component averages ('height' or 'force', see masked_height_curves.py);
+# None = take it from the CSV columns
+HOLD_CHANNEL = None
 
 # Colors for groups
 GROUP_COLORS = {
@@ -19,69 +33,33 @@ GROUP_COLORS = {
 }
 
 
-def file_group_from_name(name: str) -> str:
-    s = name.lower()
-    cond = 'ctrl' if 'ctrl' in s else ('bleb' if 'bleb' in s else 'unknown')
-    dish = 'dish1' if 'dish1' in s else ('dish2' if 'dish2' in s else 'unknown')
-    return f'{cond}-{dish}'
-
-
-def find_avg_csvs(root: str) -> List[str]:
-    files: List[str] = []
-    for dirpath, _, filenames in os.walk(root):
-        for fn in filenames:
-            if fn.endswith('_hold_avg_time.csv'):
-                files.append(os.path.join(dirpath, fn))
-    return sorted(files)
-
-
-def load_avg_curves_by_group(root: str) -> Dict[str, List[Tuple[np.ndarray, np.ndarray]]]:
+def load_avg_curves_by_group(root: str, channel: str | None = None) -> Dict[str, List[Tuple[np.ndarray, np.ndarray]]]:
     """
-    Return dict group -> list of (t_s, height_um_mean)
+    Return dict group -> list of (t_s, <channel>_mean), e.g. height_um_mean
     """
+    channel = channel or HOLD_CHANNEL or detect_hold_channel(root)
+    if channel is None:
+        return {}
+    meta, T, Y, lengths = load_component_averages(root, channel)
+    keep = duration_gate(meta['curve_duration_s'].to_numpy(), MIN_DURATION_REL)
+    report_short_components(meta, keep)
     groups: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
-    for csv_path in find_avg_csvs(root):
-        try:
-            df = pd.read_csv(csv_path)
-        except Exception as e:
-            print(f'Skip {csv_path}: cannot read ({e})')
+    for k, grp in enumerate(meta['group']):
+        n = int(lengths[k])
+        if n < 2 or not keep[k]:
             continue
-        req = {'file', 'time_s', 'height_um_mean'}
-        if df.empty or not req.issubset(df.columns):
-            print(f'Skip {csv_path}: missing required columns {req - set(df.columns)}')
-            continue
-        base = str(df['file'].iloc[0])
-        grp = file_group_from_name(base)
-        t = df['time_s'].to_numpy(dtype=float)
-        y_um = df['height_um_mean'].to_numpy(dtype=float)
-        if t.size < 2 or y_um.size != t.size:
-            continue
-        groups.setdefault(grp, []).append((t, y_um))
+        groups.setdefault(grp, []).append((T[k, :n], Y[k, :n]))
     return groups
 
 
-def align_and_stack_time(curves: List[Tuple[np.ndarray, np.ndarray]], n_points: int = 200) -> Tuple[np.ndarray, np.ndarray]:
-    if not curves:
-        return np.array([]), np.zeros((0,))
+def report_short_components(meta: pd.DataFrame, keep: np.ndarray) -> None:
+    for f, sub in meta[~keep].groupby('file', sort=True):
+        print(f'Skip {f}: {len(sub)} component(s) with hold duration below {MIN_DURATION_REL:g} x run median')
+
+
+def align_and_stack_time(curves: List[Tuple[np.ndarray, np.ndarray]], n_points: int = 200, method: str | None = None) -> Tuple[np.ndarray, np.ndarray]:
     # Common domain: 0..min max time across curves
-    t_max_common = min(float(np.max(t)) for t, _ in curves if t.size > 1)
-    if not np.isfinite(t_max_common) or t_max_common <= 0:
-        return np.array([]), np.zeros((0,))
-    t_grid = np.linspace(0.0, t_max_common, n_points)
-    mats: List[np.ndarray] = []
-    for t, y in curves:
-        msk = np.isfinite(t) & np.isfinite(y)
-        t2 = t[msk]
-        y2 = y[msk]
-        if t2.size < 2:
-            continue
-        try:
-            mats.append(np.interp(t_grid, t2, y2))
-        except Exception:
-            continue
-    if not mats:
-        return np.array([]), np.zeros((0,))
-    return t_grid, np.vstack(mats)
+    return resample_curves(curves, n_points=n_points, method=method or RESAMPLE_METHOD)
 
 
 def compute_group_stats(groups: Dict[str, List[Tuple[np.ndarray, np.ndarray]]], method: str, n_points: int = 200):
@@ -116,6 +94,7 @@ def compute_group_stats(groups: Dict[str, List[Tuple[np.ndarray, np.ndarray]]],
 
 def plot_groups(stats: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, int]], title: str, ylabel: str, out_path: str, x_label: str = 'time (s)'):
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    plt = pyplot()
     fig, ax = plt.subplots(figsize=(8, 4.2), dpi=150)
     for grp, (x, mean, std, n) in stats.items():
         if mean.size == 0:
@@ -157,25 +136,31 @@ def save_stats_csv(stats: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray, in
     print(f'Saved: {out_path}')
 
 
+def write_group_outputs(groups: Dict[str, List[Tuple[np.ndarray, np.ndarray]]], out_dir: str, channel: str) -> None:
+    """Divide- and subtract-normalized group averages of `channel`: PNG + CSV each."""
+    unit = HOLD_CHANNELS[channel][2]
+    # Divide-by-mean (a.u.) — average of per-component averages
+    stats_div = compute_group_stats(groups, method='divide', n_points=N_POINTS)
+    out_div = os.path.join(out_dir, 'hold_group_divide_by_mean_time.png')
+    plot_groups(stats_div, title='Hold — group averages of averages (divide by mean)', ylabel=f'relative {channel} (a.u.)', out_path=out_div, x_label='time (s)')
+    csv_div = os.path.join(out_dir, 'hold_group_divide_by_mean_time.csv')
+    save_stats_csv(stats_div, csv_div, domain='time', method='divide', x_label='time (s)', y_unit='a.u.')
+
+    # Subtract-mean (µm or nN) — average of per-component averages
+    stats_sub = compute_group_stats(groups, method='subtract', n_points=N_POINTS)
+    out_sub = os.path.join(out_dir, f'hold_group_subtract_mean_{unit}_time.png')
+    plot_groups(stats_sub, title='Hold — group averages of averages (subtract mean)', ylabel=f'{channel} ({UNIT_LABELS[unit]}, centered)', out_path=out_sub, x_label='time (s)')
+    csv_sub = os.path.join(out_dir, f'hold_group_subtract_mean_{unit}_time.csv')
+    save_stats_csv(stats_sub, csv_sub, domain='time', method='subtract', x_label='time (s)', y_unit=UNIT_LABELS[unit])
+
+
 def main():
-    groups = load_avg_curves_by_group(curves_dir)
+    channel = HOLD_CHANNEL or detect_hold_channel(curves_dir)
+    groups = load_avg_curves_by_group(curves_dir, channel) if channel else {}
     if not groups:
         print(f'No per-component averaged CSVs found under {curves_dir}.')
         return
-
-    # Divide-by-mean (a.u.) — average of per-component averages
-    stats_div = compute_group_stats(groups, method='divide', n_points=200)
-    out_div = os.path.join(plots_dir, 'hold_group_divide_by_mean_time.png')
-    plot_groups(stats_div, title='Hold — group averages of averages (divide by mean)', ylabel='relative height (a.u.)', out_path=out_div, x_label='time (s)')
-    csv_div = os.path.join(plots_dir, 'hold_group_divide_by_mean_time.csv')
-    save_stats_csv(stats_div, csv_div, domain='time', method='divide', x_label='time (s)', y_unit='a.u.')
-
-    # Subtract-mean (µm) — average of per-component averages
-    stats_sub = compute_group_stats(groups, method='subtract', n_points=200)
-    out_sub = os.path.join(plots_dir, 'hold_group_subtract_mean_um_time.png')
-    plot_groups(stats_sub, title='Hold — group averages of averages (subtract mean)', ylabel='height (µm, centered)', out_path=out_sub, x_label='time (s)')
-    csv_sub = os.path.join(plots_dir, 'hold_group_subtract_mean_um_time.csv')
-    save_stats_csv(stats_sub, csv_sub, domain='time', method='subtract', x_label='time (s)', y_unit='µm')
+    write_group_outputs(groups, plots_dir, channel)
 
 
 if __name__ == '__main__':
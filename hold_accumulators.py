@@ -0,0 +1,172 @@
+import os
+from glob import glob
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+"""
+Mergeable per-component accumulators for sharded runs.
+
+A component's hold average is kept as (sum, sum of squares, count) per grid
+point over its curves, so the mean/std written by a shard, by the merge step
+and by a single-node run come out of the same arithmetic. Each shard saves its
+components to one partial .npz together with the full sorted file list of the
+run and the hold channel and unit it averaged; merge_partials concatenates them
+in a fixed order and checks that every shard of the run is present exactly
+once, that all shards split the same file list and that their files cover it
+(and, when given, the current listing), and that all shards averaged the same
+channel.
+"""
+
+PARTIALS_SUBDIR = 'partials'
+
+
+def parse_shard(spec: str | None) -> Tuple[int, int]:
+    """'i/N' -> (i, N); None -> (0, 1)."""
+    if not spec:
+        return 0, 1
+    try:
+        i_s, n_s = str(spec).split('/')
+        i, n = int(i_s), int(n_s)
+    except ValueError:
+        raise ValueError(f'Shard {spec!r} is not of the form i/N')
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f'Shard {spec!r} out of range (need 0 <= i < N)')
+    return i, n
+
+
+def shard_files(files: List[str], index: int, count: int) -> List[str]:
+    """Deterministic round-robin slice of the sorted file list."""
+    return sorted(files)[index::count]
+
+
+def accumulate(A: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(sum, sum of squares, count) per column of A, ignoring NaNs."""
+    finite = np.isfinite(A)
+    A0 = np.where(finite, A, 0.0)
+    return A0.sum(axis=0), (A0 * A0).sum(axis=0), finite.sum(axis=0).astype(np.int64)
+
+
+def mean_std(s: np.ndarray, ss: np.ndarray, n: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s / n
+        std = np.sqrt(np.maximum(ss / n - mean * mean, 0.0))
+    return mean, std
+
+
+def partial_path(root: str, index: int, count: int) -> str:
+    return os.path.join(root, PARTIALS_SUBDIR, f'partial-{index:04d}of{count:04d}.npz')
+
+
+def _names(files: List[str]) -> np.ndarray:
+    return np.asarray(sorted(os.path.basename(f) for f in files), dtype=str)
+
+
+def save_partial(path: str, records: List[Dict], files: List[str], index: int, count: int,
+                 run_files: List[str], channel: str, unit: str) -> None:
+    """Write one shard's component accumulators (atomically).
+
+    records: dicts with file, component_id, group, n_curves, t_grid, sum, sumsq, count.
+    files: this shard's files; run_files: the whole run's file list before sharding.
+    channel, unit: hold channel (afm_common.HOLD_CHANNELS key) and unit of the values.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lengths = [r['t_grid'].size for r in records]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    def flat(key, dtype):
+        return np.concatenate([np.asarray(r[key], dtype=dtype) for r in records]) if records else np.zeros(0, dtype)
+
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as fh:
+        np.savez(
+            fh,
+            shard_index=np.asarray(index),
+            shard_count=np.asarray(count),
+            shard_files=np.asarray([os.path.basename(f) for f in files], dtype=str),
+            run_files=_names(run_files),
+            channel=np.asarray(channel, dtype=str),
+            unit=np.asarray(unit, dtype=str),
+            component_file=np.asarray([r['file'] for r in records], dtype=str),
+            component_id=np.asarray([r['component_id'] for r in records], dtype=np.int64),
+            group=np.asarray([r['group'] for r in records], dtype=str),
+            n_curves=np.asarray([r['n_curves'] for r in records], dtype=np.int64),
+            offsets=offsets,
+            t_grid=flat('t_grid', float),
+            sum=flat('sum', float),
+            sumsq=flat('sumsq', float),
+            count=flat('count', np.int64),
+        )
+    os.replace(tmp, path)
+
+
+def merge_partials(root: str, run_files: List[str] | None = None) -> List[Dict]:
+    """Load all partials under root/partials; returns component records sorted by output path.
+
+    Each record also carries the channel and unit its shard recorded.
+    run_files: the current input listing; partials made from a different file
+    list (files added, removed or renamed since the shards ran) are rejected.
+    """
+    paths = sorted(glob(os.path.join(root, PARTIALS_SUBDIR, 'partial-*of*.npz')))
+    if not paths:
+        raise ValueError(f'No partial results under {os.path.join(root, PARTIALS_SUBDIR)}')
+    records: List[Dict] = []
+    seen_shards: Dict[int, str] = {}
+    seen_files: Dict[str, str] = {}
+    counts = set()
+    listing = None
+    channel = None
+    for p in paths:
+        with np.load(p) as z:
+            d = {k: z[k] for k in z.files}
+        i, n = int(d['shard_index']), int(d['shard_count'])
+        counts.add(n)
+        if i in seen_shards:
+            raise ValueError(f'Shard {i}/{n} present twice: {seen_shards[i]} and {p}')
+        seen_shards[i] = p
+        names = d['run_files'].tolist()
+        if listing is None:
+            listing = names
+        elif names != listing:
+            raise ValueError(f'{p} was run on a different file list than {paths[0]}')
+        ch = (str(d['channel']), str(d['unit']))
+        if channel is None:
+            channel = ch
+        elif ch != channel:
+            raise ValueError(f'{p} averaged {ch[0]} ({ch[1]}), {paths[0]} {channel[0]} ({channel[1]})')
+        for f in d['shard_files'].tolist():
+            if f in seen_files:
+                raise ValueError(f'{f} processed by two shards: {seen_files[f]} and {p}')
+            seen_files[f] = p
+        off = d['offsets']
+        for k in range(d['component_file'].size):
+            a, b = int(off[k]), int(off[k + 1])
+            records.append({
+                'file': str(d['component_file'][k]),
+                'component_id': int(d['component_id'][k]),
+                'group': str(d['group'][k]),
+                'n_curves': int(d['n_curves'][k]),
+                't_grid': d['t_grid'][a:b],
+                'sum': d['sum'][a:b],
+                'sumsq': d['sumsq'][a:b],
+                'count': d['count'][a:b],
+                'channel': ch[0],
+                'unit': ch[1],
+            })
+    if len(counts) != 1:
+        raise ValueError(f'Partials come from runs with different shard counts {sorted(counts)}')
+    n = counts.pop()
+    missing = sorted(set(range(n)) - set(seen_shards))
+    if missing:
+        raise ValueError(f'Missing shards {missing} of {n}')
+    if sorted(seen_files) != listing:
+        raise ValueError(f'Shards cover {len(seen_files)} files, but their run listed {len(listing)}')
+    if run_files is not None and _names(run_files).tolist() != listing:
+        current = set(_names(run_files).tolist())
+        diff = sorted(current.symmetric_difference(listing))
+        raise ValueError(f'Partials were run on a different file list than the current one '
+                         f'({len(listing)} vs {len(current)} files; differing: {", ".join(diff[:5]) or "none"})')
+    # Same order as a single-node run walking the output tree (find_avg_csvs sorts paths)
+    records.sort(key=lambda r: os.path.join(r['file'], f"{r['file']}_comp{r['component_id']:03d}_hold_avg_time.csv"))
+    return records
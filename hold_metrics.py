@@ -0,0 +1,149 @@
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from afm_common import HOLD_CHANNELS, file_group_from_name, find_avg_csvs, hold_value_column
+
+"""
+Batch hold metrics shared by both clamp regimes.
+
+Hold curves (component averages or raw traces, height under force clamp or
+force under height clamp) are stacked into NaN-padded (n_curves, n_max)
+arrays with their lengths, and every metric is computed for all rows in one
+pass: tail slope (creep rate / relaxation rate), mean over the first or last
+window (initial and steady level) and a log-log power-law fit for passive
+references.
+"""
+
+
+def stack_curves(curves: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(T, Y, lengths): curves as rows, padded with NaN to the longest one."""
+    lengths = np.asarray([np.asarray(t).size for t, _y in curves], dtype=np.int64)
+    n_max = int(lengths.max()) if lengths.size else 0
+    T = np.full((lengths.size, n_max), np.nan)
+    Y = np.full((lengths.size, n_max), np.nan)
+    for k, (t, y) in enumerate(curves):
+        T[k, :lengths[k]] = t
+        Y[k, :lengths[k]] = y
+    return T, Y, lengths
+
+
+def _columns(lengths: np.ndarray, n_max: int) -> np.ndarray:
+    return np.broadcast_to(np.arange(n_max), (lengths.size, n_max))
+
+
+def tail_slopes(T: np.ndarray, Y: np.ndarray, lengths: np.ndarray, frac: float) -> np.ndarray:
+    """Least-squares slope over the last `frac` of each row's samples (NaN if < 2 usable points)."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    start = np.floor((1.0 - frac) * lengths).astype(np.int64)
+    col = _columns(lengths, T.shape[1])
+    use = (col >= start[:, None]) & (col < lengths[:, None]) & np.isfinite(T) & np.isfinite(Y)
+    n = use.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = np.where(use, T, 0.0).sum(axis=1) / n
+        my = np.where(use, Y, 0.0).sum(axis=1) / n
+        dx = np.where(use, T - mx[:, None], 0.0)
+        dy = np.where(use, Y - my[:, None], 0.0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    ok = (lengths >= 3) & (start < lengths - 1) & (n >= 2)
+    return np.where(ok, slope, np.nan)
+
+
+def window_means(Y: np.ndarray, lengths: np.ndarray, frac: float, where: str = 'last') -> np.ndarray:
+    """NaN-aware mean of each row over its first or last `frac` of samples (at least one)."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    width = np.maximum(np.ceil(frac * lengths).astype(np.int64), 1)
+    col = _columns(lengths, Y.shape[1])
+    if where == 'last':
+        use = (col >= (lengths - width)[:, None]) & (col < lengths[:, None])
+    elif where == 'first':
+        use = col < np.minimum(width, lengths)[:, None]
+    else:
+        raise ValueError(f"where must be 'first' or 'last', not {where!r}")
+    use &= np.isfinite(Y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(use, Y, 0.0).sum(axis=1) / use.sum(axis=1)
+
+
+def fit_power_law(t: np.ndarray, y: np.ndarray) -> Tuple[float, float]:
+    """(y1, exponent) of y = y1 * t^exponent, fitted in log-log over t > 0, y > 0."""
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = np.isfinite(t) & np.isfinite(y) & (t > 0) & (y > 0)
+    if ok.sum() < 2:
+        return np.nan, np.nan
+    b, log_a = np.polyfit(np.log(t[ok]), np.log(y[ok]), 1)
+    return float(np.exp(log_a)), float(b)
+
+
+def power_law(T: np.ndarray, y1: float, exponent: float) -> np.ndarray:
+    """Evaluate y1 * t^exponent; t = 0 (hold start) takes the value at the row's first t > 0."""
+    T = np.asarray(T, dtype=float)
+    pos = np.where(T > 0, T, np.inf)
+    t_first = pos.min(axis=-1, keepdims=True)
+    return y1 * np.maximum(T, t_first) ** exponent
+
+
+def duration_gate(durations: np.ndarray, rel: float | None) -> np.ndarray:
+    """Keep mask: durations >= rel * their median, taken over every curve given (across maps).
+
+    Applied to component averages before group averaging, so a map whose holds
+    are all short cannot shrink the common time grid (the per-map QC reference
+    cannot see that). rel None or 0 keeps everything.
+    """
+    d = np.asarray(durations, dtype=float)
+    if not rel:
+        return np.ones(d.shape, dtype=bool)
+    ok = np.isfinite(d)
+    if not ok.any():
+        return ok
+    return ok & (d >= float(rel) * float(np.median(d[ok])))
+
+
+def detect_hold_channel(root: str) -> str | None:
+    """HOLD_CHANNELS key of the per-component average CSVs under root (None if there are none)."""
+    for csv_path in find_avg_csvs(root):
+        try:
+            columns = pd.read_csv(csv_path, nrows=0).columns
+        except Exception:
+            continue
+        for channel in HOLD_CHANNELS:
+            if hold_value_column(channel) in columns:
+                return channel
+    return None
+
+
+def load_component_averages(root: str, channel: str = 'height') -> Tuple[pd.DataFrame, np.ndarray, np.ndarray, np.ndarray]:
+    """Per-component average CSVs under root as (meta, T, Y, lengths) in sorted path order.
+
+    meta has one row per component (file, component_id, group, n_curves,
+    curve_duration_s); Y holds the channel mean in the CSV unit.
+    """
+    col = hold_value_column(channel)
+    rows: List[dict] = []
+    curves: List[Tuple[np.ndarray, np.ndarray]] = []
+    for csv_path in find_avg_csvs(root):
+        try:
+            # round_trip keeps the float64 values bit-exact (sharded merges compare against them)
+            df = pd.read_csv(csv_path, float_precision='round_trip')
+        except Exception as e:
+            print(f'Skip {csv_path}: cannot read ({e})')
+            continue
+        req = {'file', 'time_s', col}
+        if df.empty or not req.issubset(df.columns):
+            print(f'Skip {csv_path}: missing required columns {req - set(df.columns)}')
+            continue
+        dfg = df.sort_values('time_s')
+        t = dfg['time_s'].to_numpy(dtype=float)
+        base = str(df['file'].iloc[0])
+        rows.append({
+            'file': base,
+            'component_id': int(df['component_id'].iloc[0]) if 'component_id' in df.columns else np.nan,
+            'group': file_group_from_name(base),
+            'n_curves': int(df['n_curves'].iloc[0]) if 'n_curves' in df.columns else np.nan,
+            'curve_duration_s': float(np.nanmax(t) - np.nanmin(t)) if t.size > 1 else np.nan,
+        })
+        curves.append((t, dfg[col].to_numpy(dtype=float)))
+    T, Y, lengths = stack_curves(curves)
+    return pd.DataFrame(rows, columns=['file', 'component_id', 'group', 'n_curves', 'curve_duration_s']), T, Y, lengths
@@ -0,0 +1,137 @@
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from afm_common import HOLD_CHANNELS, UNIT_LABELS, pyplot, seaborn
+from component_hold_steepness_boxplot import cond_from_group, welch_pairwise
+from hold_metrics import detect_hold_channel, fit_power_law, load_component_averages, power_law, tail_slopes, window_means
+
+"""
+Height-clamp force relaxation per component (README section B), in batch.
+
+Reads the per-component averages written by masked_height_curves.py (with
+HOLD_CHANNEL = 'force' for height clamp) and computes, for all components at once, the initial
+force (first window), steady force (mean over the last window), relaxation
+amplitude (initial - steady) and tail relaxation rate. With PASSIVE_GROUP set,
+a power law F_passive(t) = F1 * t^b is fitted to the pooled averages of that
+reference (e.g. blebbistatin) and the same metrics are reported for
+F_active = F_live - F_passive. Works on the height channel too (creep under
+force clamp), with the same engine (hold_metrics.py).
+"""
+
+# Directory with per-component AVERAGED CSVs generated by masked_height_curves.py
+curves_dir = '/data/2025-09-05_curves'
+# Output directory for the metrics table, plots and p-values
+plots_dir = '/data/2025-09-05_relaxation'
+
+# Hold channel of the per-component averages; None = take it from the CSV columns
+HOLD_CHANNEL = None
+# Windows as fractions of each hold: initial level, steady level, slope fit
+INITIAL_FRACTION = 0.05
+STEADY_FRACTION = 0.2
+TAIL_FRACTION = 0.8
+# Passive reference: a condition ('bleb', 'ctrl') or exact group ('bleb-dish1'); None = no subtraction
+PASSIVE_GROUP = 'bleb'
+
+
+def hold_level_metrics(T: np.ndarray, Y: np.ndarray, lengths: np.ndarray, unit: str, prefix: str = '') -> Dict[str, np.ndarray]:
+    """Initial/steady level, amplitude and tail rate of every row, as named columns."""
+    initial = window_means(Y, lengths, INITIAL_FRACTION, where='first')
+    steady = window_means(Y, lengths, STEADY_FRACTION, where='last')
+    return {
+        f'{prefix}initial_{unit}': initial,
+        f'{prefix}steady_{unit}': steady,
+        f'{prefix}amplitude_{unit}': initial - steady,
+        f'{prefix}rate_{unit}_per_s': tail_slopes(T, Y, lengths, TAIL_FRACTION),
+    }
+
+
+def passive_rows(meta: pd.DataFrame, reference: str) -> np.ndarray:
+    groups = meta['group'].astype(str)
+    return ((groups == reference) | (groups.map(cond_from_group) == reference)).to_numpy()
+
+
+def relaxation_table(meta: pd.DataFrame, T: np.ndarray, Y: np.ndarray, lengths: np.ndarray,
+                     channel: str, passive: str | None = PASSIVE_GROUP) -> Tuple[pd.DataFrame, Dict | None]:
+    """Metrics per component (one row each) and the passive power-law fit (None without reference)."""
+    unit = HOLD_CHANNELS[channel][2]
+    out = meta.copy()
+    for col, vals in hold_level_metrics(T, Y, lengths, unit).items():
+        out[col] = vals
+    if not passive:
+        return out, None
+
+    ref = passive_rows(meta, passive)
+    if not ref.any():
+        print(f'No components of passive reference {passive!r}; skipping passive subtraction')
+        return out, None
+    # One fit over the pooled reference averages
+    y1, exponent = fit_power_law(T[ref].ravel(), Y[ref].ravel())
+    fit = {'reference': passive, 'n_components': int(ref.sum()), f'y1_{unit}': y1, 'exponent': exponent}
+    if not np.isfinite(y1):
+        print(f'Cannot fit a power law to passive reference {passive!r}; skipping passive subtraction')
+        return out, fit
+    active = Y - power_law(T, y1, exponent)
+    for col, vals in hold_level_metrics(T, active, lengths, unit, prefix='active_').items():
+        out[col] = vals
+    out['passive_reference'] = ref
+    return out, fit
+
+
+def save_boxplots(df: pd.DataFrame, cols: List[str], unit: str, out_path: str) -> None:
+    plt = pyplot()
+    sns = seaborn()
+    fig, axes = plt.subplots(1, len(cols), figsize=(5 * len(cols), 4.2), dpi=150, squeeze=False)
+    for ax, col in zip(axes[0], cols):
+        sns.boxplot(data=df, x='group', y=col, ax=ax)
+        sns.stripplot(data=df, x='group', y=col, ax=ax, color='k', alpha=0.4, jitter=0.15)
+        ax.set_title(col)
+        ax.set_ylabel(f'{col} [{UNIT_LABELS[unit]}]')
+        ax.set_xlabel('group')
+        ax.tick_params(axis='x', labelrotation=30)
+    fig.tight_layout()
+    fig.savefig(out_path, dpi=150)
+    plt.close(fig)
+    print(f'Saved: {out_path}')
+
+
+def main():
+    channel = HOLD_CHANNEL or detect_hold_channel(curves_dir)
+    if channel is None:
+        print(f'No per-component averaged CSVs found under {curves_dir}')
+        return
+    meta, T, Y, lengths = load_component_averages(curves_dir, channel)
+    if meta.empty:
+        print(f'No per-component averaged {channel} CSVs found under {curves_dir}')
+        return
+
+    unit = HOLD_CHANNELS[channel][2]
+    df, fit = relaxation_table(meta, T, Y, lengths, channel=channel, passive=PASSIVE_GROUP)
+    os.makedirs(plots_dir, exist_ok=True)
+    out_csv = os.path.join(plots_dir, f'hold_relaxation_{channel}_metrics.csv')
+    df.to_csv(out_csv, index=False)
+    print(f'Saved: {out_csv}')
+    if fit is not None:
+        fit_csv = os.path.join(plots_dir, f'hold_relaxation_{channel}_passive_power_law.csv')
+        pd.DataFrame([fit]).to_csv(fit_csv, index=False)
+        print(f'Saved: {fit_csv}')
+
+    prefix = 'active_' if f'active_steady_{unit}' in df.columns else ''
+    cols = [f'{prefix}steady_{unit}', f'{prefix}amplitude_{unit}']
+    save_boxplots(df, cols, unit, os.path.join(plots_dir, f'hold_relaxation_{channel}_{prefix}boxplot.png'))
+
+    rows: List[Dict] = []
+    for col in cols:
+        rows.extend({'metric': col, 'group1': r['group1'], 'group2': r['group2'], 'n1': r['n1'], 'n2': r['n2'],
+                     'diff_mean': r[f'diff_mean_{col}'], 'pvalue_welch': r['pvalue_welch']}
+                    for r in welch_pairwise(df, value_col=col))
+    if rows:
+        pvalues_csv = os.path.join(plots_dir, f'hold_relaxation_{channel}_pvalues_pairwise.csv')
+        pd.DataFrame(rows).to_csv(pvalues_csv, index=False)
+        print(f'Saved: {pvalues_csv}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+from typing import List, Tuple
+
+import numpy as np
+
+"""
+Resampling of hold curves (time_s, value) onto a common time grid.
+
+All methods share one interface: a list of (t, y) curves in, (t_grid, A) out,
+where A has one row per usable curve. The common domain is 0 .. min(max t)
+across curves, as in the original linear interpolation.
+
+Methods:
+- 'linear'     plain np.interp at grid points (original behaviour; aliases noise)
+- 'block_mean' mean of raw samples in uniform bins, reported at bin centers
+- 'polyphase'  interpolate to a fine uniform grid near the densest native rate, then
+               anti-aliased polyphase decimation (scipy.signal.resample_poly)
+- 'log'        mean of raw samples in log-spaced bins (for power-law creep)
+"""
+
+RESAMPLE_METHODS = ('linear', 'block_mean', 'polyphase', 'log')
+
+
+def _clean_curves(curves: List[Tuple[np.ndarray, np.ndarray]]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    out: List[Tuple[np.ndarray, np.ndarray]] = []
+    for t, y in curves:
+        t = np.asarray(t, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if t.size < 2 or y.size != t.size:
+            continue
+        msk = np.isfinite(t) & np.isfinite(y)
+        if np.count_nonzero(msk) < 2:
+            continue
+        out.append((t[msk], y[msk]))
+    return out
+
+
+def common_t_max(curves: List[Tuple[np.ndarray, np.ndarray]]) -> float:
+    """Common time domain end: min over curves of their max time."""
+    try:
+        return min(float(np.max(t)) for t, _ in curves if t.size > 1)
+    except ValueError:
+        return 0.0
+
+
+def _concat(curves: List[Tuple[np.ndarray, np.ndarray]], t_max: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Flatten curves restricted to [0, t_max] into (row_index, t, y)."""
+    rows, ts, ys = [], [], []
+    for r, (t, y) in enumerate(curves):
+        msk = (t >= 0.0) & (t <= t_max)
+        rows.append(np.full(np.count_nonzero(msk), r, dtype=np.int64))
+        ts.append(t[msk])
+        ys.append(y[msk])
+    return np.concatenate(rows), np.concatenate(ts), np.concatenate(ys)
+
+
+def _interp_rows(curves: List[Tuple[np.ndarray, np.ndarray]], t_grid: np.ndarray) -> np.ndarray:
+    A = np.empty((len(curves), t_grid.size), dtype=float)
+    for r, (t, y) in enumerate(curves):
+        A[r] = np.interp(t_grid, t, y)
+    return A
+
+
+def _bin_means(curves: List[Tuple[np.ndarray, np.ndarray]], edges: np.ndarray, t_centers: np.ndarray) -> np.ndarray:
+    """Mean of raw samples per (curve, bin) in a single bincount pass.
+
+    Bins that received no samples (e.g. narrow early log bins) fall back to
+    linear interpolation at the bin center.
+    """
+    n_rows = len(curves)
+    n_bins = edges.size - 1
+    rows, t, y = _concat(curves, float(edges[-1]))
+    b = np.clip(np.searchsorted(edges, t, side='right') - 1, 0, n_bins - 1)
+    flat = rows * n_bins + b
+    sums = np.bincount(flat, weights=y, minlength=n_rows * n_bins)
+    counts = np.bincount(flat, minlength=n_rows * n_bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        A = (sums / counts).reshape(n_rows, n_bins)
+    empty = counts.reshape(n_rows, n_bins) == 0
+    if np.any(empty):
+        A_fill = _interp_rows(curves, t_centers)
+        A[empty] = A_fill[empty]
+    return A
+
+
+def _resample_block_mean(curves, t_max: float, n_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    edges = np.linspace(0.0, t_max, n_points + 1)
+    t_grid = 0.5 * (edges[:-1] + edges[1:])
+    return t_grid, _bin_means(curves, edges, t_grid)
+
+
+def _resample_log(curves, t_max: float, n_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    # First edge: smallest positive first-step among curves (sampling interval)
+    steps = [float(t[1] - t[0]) for t, _ in curves if t.size > 1 and t[1] > t[0]]
+    t_min = min(steps) if steps else t_max / n_points
+    t_min = min(t_min, t_max / n_points)
+    edges = np.concatenate(([0.0], np.geomspace(t_min, t_max, n_points)))
+    t_grid = np.concatenate(([0.5 * t_min], np.sqrt(edges[1:-1] * edges[2:])))
+    return t_grid, _bin_means(curves, edges, t_grid)
+
+
+def _resample_polyphase(curves, t_max: float, n_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    from scipy.signal import resample_poly
+
+    # Fine grid at the densest curve's rate: dense rows are anti-aliased before
+    # decimation; sparse rows are only upsampled by interpolation, which is harmless
+    n_native = max(int(np.count_nonzero(t <= t_max)) for t, _ in curves)
+    q = max(1, n_native // n_points)
+    t_fine = np.linspace(0.0, t_max, n_points * q)
+    A_fine = _interp_rows(curves, t_fine)
+    if q == 1:
+        return t_fine, A_fine
+    # padtype='line' extends each row linearly, so drifting hold curves do not ring at the edges
+    A = resample_poly(A_fine, 1, q, axis=1, padtype='line')
+    return t_fine[::q], A
+
+
+def resample_curves(curves: List[Tuple[np.ndarray, np.ndarray]], n_points: int = 200, method: str = 'linear') -> Tuple[np.ndarray, np.ndarray]:
+    """Resample (t, y) curves onto a common grid; returns (t_grid, A[n_curves, n_points]).
+
+    Returns (empty, zeros((0,))) when there is nothing to resample, matching
+    align_and_stack_time in group_component_curves.py.
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f'Unknown resample method {method!r}; expected one of {RESAMPLE_METHODS}')
+    curves = _clean_curves(curves)
+    if not curves:
+        return np.array([]), np.zeros((0,))
+    t_max = common_t_max(curves)
+    if not np.isfinite(t_max) or t_max <= 0:
+        return np.array([]), np.zeros((0,))
+
+    if method == 'linear':
+        t_grid = np.linspace(0.0, t_max, n_points)
+        return t_grid, _interp_rows(curves, t_grid)
+    if method == 'block_mean':
+        return _resample_block_mean(curves, t_max, n_points)
+    if method == 'log':
+        return _resample_log(curves, t_max, n_points)
+    return _resample_polyphase(curves, t_max, n_points)
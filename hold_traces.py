@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+import time
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+"""
+Per-curve (unaveraged) hold-trace store.
+
+Ragged layout: every trace's time (s, from hold start) and value (height in m
+for force-clamp holds, force in N for height-clamp holds) are float32 runs in two flat buffers; offsets[i] ..
+offsets[i + 1] is trace i. The buffers are cut into chunks of CHUNK_TRACES
+traces, each zlib-compressed and appended to traces.bin. Readers memory-map
+traces.bin and decompress only the chunks holding the requested traces, so
+any subset can be read without loading the rest.
+
+A writer fills a fresh version subdirectory and publishes it by replacing
+the CURRENT pointer file (os.replace), so readers see either the previous
+store or the complete new one, never a mix; older versions are removed after
+publishing. Version contents:
+    traces.bin    compressed chunks (time block, then value block)
+    index.npz     offsets, per-chunk byte ranges and first trace
+    meta.csv      one row per trace: file, grid_x, grid_y, component_id,
+                  group, spring_constant, n_samples
+    store.json    channel name/unit and chunk size
+"""
+
+CHUNK_TRACES = 256
+ZLIB_LEVEL = 6
+META_COLUMNS = ('file', 'grid_x', 'grid_y', 'component_id', 'group', 'spring_constant', 'n_samples')
+POINTER = 'CURRENT'
+
+
+def current_version_dir(directory: str) -> str:
+    """Published version subdirectory of a trace store."""
+    try:
+        with open(os.path.join(directory, POINTER), encoding='utf-8') as fh:
+            return os.path.join(directory, fh.read().strip())
+    except FileNotFoundError:
+        raise FileNotFoundError(f'No published hold traces in {directory}')
+
+
+class HoldTraceWriter:
+    """Append traces file by file; close() writes the index and metadata and publishes.
+
+    Use as a context manager: an exception discards the unpublished version.
+    """
+
+    def __init__(self, directory: str, channel: str = 'height (measured)', unit: str = 'm',
+                 chunk_traces: int = CHUNK_TRACES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.channel = channel
+        self.unit = unit
+        self.chunk_traces = int(chunk_traces)
+        self._version = f'v{time.time_ns():x}-{os.getpid()}'
+        self._vdir = os.path.join(directory, self._version)
+        os.makedirs(self._vdir)
+        self._bin = open(os.path.join(self._vdir, 'traces.bin'), 'wb')
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._meta: List[Dict] = []
+        self._lengths: List[int] = []
+        self._chunk_bytes: List[Tuple[int, int, int]] = []  # (byte offset, time bytes, total bytes)
+        self._chunk_first: List[int] = []
+        self._pos = 0
+
+    @property
+    def n_traces(self) -> int:
+        return len(self._lengths)
+
+    def add(self, t: np.ndarray, y: np.ndarray, **meta) -> None:
+        t = np.asarray(t, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        if t.size != y.size:
+            raise ValueError(f'time and value lengths differ ({t.size} != {y.size})')
+        self._pending.append((t, y))
+        self._meta.append({k: meta.get(k) for k in META_COLUMNS if k != 'n_samples'} | {'n_samples': int(t.size)})
+        self._lengths.append(int(t.size))
+        if len(self._pending) >= self.chunk_traces:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        t_blob = zlib.compress(np.concatenate([t for t, _ in self._pending]).tobytes(), ZLIB_LEVEL)
+        y_blob = zlib.compress(np.concatenate([y for _, y in self._pending]).tobytes(), ZLIB_LEVEL)
+        self._bin.write(t_blob)
+        self._bin.write(y_blob)
+        self._chunk_bytes.append((self._pos, len(t_blob), len(t_blob) + len(y_blob)))
+        self._chunk_first.append(len(self._lengths) - len(self._pending))
+        self._pos += len(t_blob) + len(y_blob)
+        self._pending = []
+
+    def close(self) -> None:
+        self._flush()
+        self._bin.close()
+        offsets = np.zeros(len(self._lengths) + 1, dtype=np.int64)
+        np.cumsum(self._lengths, out=offsets[1:])
+        d = self._vdir
+        np.savez(os.path.join(d, 'index.npz'), offsets=offsets,
+                 chunk_bytes=np.asarray(self._chunk_bytes, dtype=np.int64).reshape(-1, 3),
+                 chunk_first=np.asarray(self._chunk_first + [len(self._lengths)], dtype=np.int64))
+        pd.DataFrame(self._meta, columns=list(META_COLUMNS)).to_csv(os.path.join(d, 'meta.csv'), index=False)
+        with open(os.path.join(d, 'store.json'), 'w', encoding='utf-8') as fh:
+            json.dump({'channel': self.channel, 'unit': self.unit, 'chunk_traces': self.chunk_traces,
+                       'n_traces': len(self._lengths)}, fh, indent=1)
+        # Publish: one atomic pointer swap, then drop the versions it replaced
+        tmp = os.path.join(self.directory, f'.{POINTER}.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            fh.write(self._version)
+        os.replace(tmp, os.path.join(self.directory, POINTER))
+        for name in os.listdir(self.directory):
+            if name != self._version and name.startswith('v') and os.path.isdir(os.path.join(self.directory, name)):
+                # A reader may still map an old traces.bin (Windows); removed by a later close
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def abort(self) -> None:
+        """Discard the unpublished version; the published store is left as it was."""
+        self._bin.close()
+        shutil.rmtree(self._vdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class HoldTraces:
+    """Read-only view of a trace store; meta is a DataFrame indexed by trace number."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        directory = current_version_dir(directory)
+        with open(os.path.join(directory, 'store.json'), encoding='utf-8') as fh:
+            self.info = json.load(fh)
+        with np.load(os.path.join(directory, 'index.npz')) as z:
+            self.offsets = z['offsets']
+            self.chunk_bytes = z['chunk_bytes']
+            self.chunk_first = z['chunk_first']
+        self.meta = pd.read_csv(os.path.join(directory, 'meta.csv'))
+        path = os.path.join(directory, 'traces.bin')
+        self._bin = np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path) else np.zeros(0, np.uint8)
+        self._cache: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return int(self.offsets.size - 1)
+
+    def select(self, **filters) -> np.ndarray:
+        """Trace indices whose metadata match all filters (value or list of values)."""
+        keep = np.ones(len(self.meta), dtype=bool)
+        for col, val in filters.items():
+            vals = val if isinstance(val, (list, tuple, set, np.ndarray)) else [val]
+            keep &= self.meta[col].isin(list(vals)).to_numpy()
+        return np.flatnonzero(keep)
+
+    def _chunk(self, c: int) -> Tuple[np.ndarray, np.ndarray]:
+        if c not in self._cache:
+            pos, n_t, n_all = (int(v) for v in self.chunk_bytes[c])
+            raw = self._bin[pos:pos + n_all]
+            t = np.frombuffer(zlib.decompress(raw[:n_t].tobytes()), dtype=np.float32)
+            y = np.frombuffer(zlib.decompress(raw[n_t:].tobytes()), dtype=np.float32)
+            # Keep only the most recent chunks; subset reads are usually local
+            if len(self._cache) >= 8:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[c] = (t, y)
+        return self._cache[c]
+
+    def read(self, indices) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(time_s, value) per requested trace, as float64, in the order given."""
+        idx = np.asarray(indices, dtype=np.int64).ravel()
+        chunks = np.searchsorted(self.chunk_first, idx, side='right') - 1
+        out: List[Tuple[np.ndarray, np.ndarray]] = []
+        for i, c in zip(idx, chunks):
+            t, y = self._chunk(int(c))
+            base = int(self.offsets[self.chunk_first[c]])
+            a, b = int(self.offsets[i]) - base, int(self.offsets[i + 1]) - base
+            out.append((t[a:b].astype(float), y[a:b].astype(float)))
+        return out
+
+
+def open_hold_traces(directory: str) -> HoldTraces:
+    return HoldTraces(directory)
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+"""
+Cold-start import benchmark for the batch scripts.
+
+Each module is imported in a fresh interpreter; the script fails (exit code 1)
+when an import exceeds IMPORT_BUDGET_S or pulls in one of HEAVY_MODULES at
+import time. Run it after touching module-level imports:
+
+    python import_benchmark.py
+
+The same check runs in the test suite (tests/test_import_time.py).
+"""
+
+MODULES = [
+    'afm_run',
+    'masked_height_curves',
+    'group_component_curves',
+    'component_hold_steepness_boxplot',
+    'batch_setpoint_colormap',
+    'parameter_sweep',
+    'map_filtering',
+    'curve_qc',
+    'curve_browser',
+    'elasticity_map',
+    'hold_relaxation',
+    'shard_merge',
+    'hold_traces',
+]
+# Seconds per module import, timed inside the fresh interpreter
+IMPORT_BUDGET_S = 1.0
+# Must only be imported inside the stages that use them
+HEAVY_MODULES = ('matplotlib', 'seaborn', 'scipy', 'skimage', 'afmformats')
+REPEATS = 3
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_PROBE = (
+    'import sys, time, json\n'
+    't0 = time.perf_counter()\n'
+    'import {module}\n'
+    'dt = time.perf_counter() - t0\n'
+    'heavy = sorted(m for m in {heavy!r} if m in sys.modules)\n'
+    'print(json.dumps({{"seconds": dt, "heavy": heavy}}))\n'
+)
+
+
+def measure(module: str, repeats: int = REPEATS) -> Dict:
+    """Best-of-`repeats` import time of `module` in a fresh interpreter."""
+    best = None
+    heavy: List[str] = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                             capture_output=True, text=True, check=True, cwd=_HERE)
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        best = res['seconds'] if best is None else min(best, res['seconds'])
+        heavy = res['heavy']
+    return {'module': module, 'seconds': best, 'heavy': heavy}
+
+
+def main() -> int:
+    failed = 0
+    for module in MODULES:
+        res = measure(module)
+        over = res['seconds'] > IMPORT_BUDGET_S
+        status = 'FAIL' if (over or res['heavy']) else 'ok'
+        failed += status == 'FAIL'
+        extra = f" heavy: {', '.join(res['heavy'])}" if res['heavy'] else ''
+        print(f"{status:4s} {module:36s} {res['seconds'] * 1e3:7.1f} ms{extra}")
+    print(f'{failed} of {len(MODULES)} modules over budget ({IMPORT_BUDGET_S:.2f} s) or importing heavy dependencies')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
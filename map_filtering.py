@@ -0,0 +1,150 @@
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from glob import glob
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from curve_store import FILTERED_SUFFIX, CurveStore, cached_store_dir, load_curve_store_cached, save_curve_store, segment_runs
+
+"""
+Batch smoothing of whole force maps.
+
+Filters run over the concatenated curve store one segment run at a time (never
+across a segment or curve boundary) and are spread over worker processes in
+contiguous chunks of runs; one process pool serves the whole run. Filtered
+columns are added to the cached curve store of each map
+(curve_store.load_curve_store_cached) as '<column>_filtered', so the cache key
+is kept and other stages sharing cache_dir read them with USE_FILTERED = True
+(curves stage and its QC, curve browser, plot_data.py); re-decoding a changed
+source file drops them with the rest of the stale store.
+
+    python afm_run.py filter --config run.toml
+"""
+
+# Minimal configuration
+folder = '/data/2025-09-05'
+pattern = '*.jpk-force-map'
+# Curve store cache shared with the other stages (see curve_store.load_curve_store_cached)
+cache_dir = '/data/2025-09-05_stores'
+
+FILTER_COLUMNS = ('force', 'height (measured)')
+# 'gaussian' (sigma), 'savgol' (window, polyorder) or 'median' (size); sizes in samples
+FILTER_METHOD = 'gaussian'
+FILTER_PARAMS = {'sigma': 50}
+# Worker processes; None = os.cpu_count(), 1 = run in-process
+N_JOBS = None
+
+FILTER_METHODS = ('gaussian', 'savgol', 'median')
+
+
+def _filter_run(y: np.ndarray, method: str, params: Dict) -> np.ndarray:
+    if y.size < 2:
+        return y.astype(float)
+    if method == 'gaussian':
+        from scipy.ndimage import gaussian_filter1d
+        return gaussian_filter1d(y, sigma=float(params.get('sigma', 50)), mode='nearest')
+    if method == 'savgol':
+        from scipy.signal import savgol_filter
+        polyorder = int(params.get('polyorder', 3))
+        window = min(int(params.get('window', 101)), y.size)
+        if window % 2 == 0:
+            window -= 1
+        if window <= polyorder:
+            return y.astype(float)
+        return savgol_filter(y, window, polyorder, mode='interp')
+    if method == 'median':
+        from scipy.ndimage import median_filter
+        return median_filter(y, size=int(params.get('size', 51)), mode='nearest')
+    raise ValueError(f'Unknown filter method {method!r}; expected one of {FILTER_METHODS}')
+
+
+def _filter_chunk(args: Tuple[np.ndarray, np.ndarray, np.ndarray, str, Dict]) -> np.ndarray:
+    """Filter a contiguous block of runs; run bounds are relative to the block."""
+    y, starts, ends, method, params = args
+    out = np.empty(y.shape, dtype=float)
+    for a, b in zip(starts, ends):
+        out[a:b] = _filter_run(np.asarray(y[a:b], dtype=float), method, params)
+    return out
+
+
+def _chunk_runs(starts: np.ndarray, ends: np.ndarray, n_chunks: int) -> List[Tuple[int, int]]:
+    """Split runs into n_chunks groups of roughly equal sample count (run index ranges)."""
+    if starts.size == 0:
+        return []
+    targets = np.linspace(0, ends[-1], n_chunks + 1)[1:-1]
+    cuts = np.unique(np.searchsorted(ends, targets, side='left') + 1)
+    cuts = cuts[(cuts > 0) & (cuts < starts.size)]
+    bounds = np.concatenate(([0], cuts, [starts.size]))
+    return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def filter_store(store: CurveStore, columns=None, method: str | None = None, params: Dict | None = None,
+                 n_chunks: int | None = None, executor: Executor | None = None) -> List[str]:
+    """Add '<column>_filtered' for each requested column; returns the names added.
+
+    Settings default to FILTER_COLUMNS, FILTER_METHOD and FILTER_PARAMS. Runs
+    are split into n_chunks contiguous blocks (default N_JOBS, None =
+    os.cpu_count()), mapped over executor when given and filtered in-process
+    otherwise.
+    """
+    columns = FILTER_COLUMNS if columns is None else columns
+    method = method or FILTER_METHOD
+    if method not in FILTER_METHODS:
+        raise ValueError(f'Unknown filter method {method!r}; expected one of {FILTER_METHODS}')
+    params = dict(FILTER_PARAMS if params is None else params)
+    starts, ends = segment_runs(store)
+    chunks = _chunk_runs(starts, ends, n_chunks or N_JOBS or os.cpu_count() or 1)
+
+    added: List[str] = []
+    for col in columns:
+        if col not in store.columns:
+            print(f'Skip filter of {col!r}: column not in store {store.name}')
+            continue
+        y = store.columns[col]
+        tasks = []
+        for r0, r1 in chunks:
+            a, b = int(starts[r0]), int(ends[r1 - 1])
+            tasks.append((np.asarray(y[a:b]), starts[r0:r1] - a, ends[r0:r1] - a, method, params))
+        if executor is None or len(tasks) <= 1:
+            parts = [_filter_chunk(t) for t in tasks]
+        else:
+            parts = list(executor.map(_filter_chunk, tasks))
+        name = f'{col}{FILTERED_SUFFIX}'
+        store.columns[name] = np.concatenate(parts) if parts else np.zeros(0)
+        added.append(name)
+    return added
+
+
+def process_file(path: str, executor: Executor | None = None) -> None:
+    base = os.path.splitext(os.path.basename(path))[0]
+    try:
+        store = load_curve_store_cached(path, cache_dir)
+    except Exception as e:
+        print(f'Skip {base}: cannot open ({e})')
+        return
+    added = filter_store(store, executor=executor)
+    store_dir = cached_store_dir(path, cache_dir)
+    # Only the filtered columns are (re)written; raw columns stay memory-mapped as cached
+    save_curve_store(store, store_dir, only=added)
+    print(f'Saved: {store_dir} ({store.n_curves} curves, {FILTER_METHOD} filtered {", ".join(added)})')
+
+
+def main():
+    if not cache_dir:
+        print('Set cache_dir: filtered columns are stored in the cached curve stores')
+        return
+    files = sorted(glob(os.path.join(folder, pattern)))
+    if not files:
+        print(f'No files found in {folder} matching {pattern}')
+        return
+    n_jobs = N_JOBS or os.cpu_count() or 1
+    # One worker pool for every column of every map
+    with (ProcessPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else nullcontext()) as executor:
+        for path in files:
+            process_file(path, executor=executor)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,51 @@
 import os
+from contextlib import nullcontext
 from glob import glob
 from typing import Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
-import afmformats as af
-from skimage import io as skio
-from skimage.measure import label as cc_label
-import matplotlib.pyplot as plt
+
+from afm_common import HOLD_CHANNELS, UNIT_LABELS, file_group_from_name, hold_value_column, pyplot
+from curve_qc import compute_curve_qc, flag_curves, save_qc_outputs
+from curve_store import channel_column, extract_segments, load_curve_store_cached
+from hold_accumulators import accumulate, mean_std, parse_shard, partial_path, save_partial, shard_files
+from hold_resampling import resample_curves
+from hold_traces import HoldTraceWriter
 
 # Minimal configuration
+# Hold channel (afm_common.HOLD_CHANNELS): 'height' for force-clamp maps (creep),
+# 'force' for height-clamp maps (relaxation; see hold_relaxation.py)
+HOLD_CHANNEL = 'height'
 folder = '/data/2025-09-05'
 pattern = '*.jpk-force-map'
 masks_dir = '/data/2025-09-05/masky'
 out_dir = '/data/2025-09-05_curves'
-### jeden file je naprd - ma kratke hold krivky - tak mu vymazat krivky před dalším krokem!!!!
+# Decoded curve stores, keyed by source file; safe to share between runs (None = no cache)
+cache_dir = None
+# Short/bad hold curves are rejected automatically by the QC pass (curve_qc.py);
+# a QC map and rejection report are written next to each file's averages.
+# Overrides of curve_qc.QC_THRESHOLDS (the defaults live there), e.g.
+# {'min_hold_duration_s': 10.0}: min_hold_duration_rel only compares curves within
+# one map, so a map whose holds are all short is caught by min_hold_duration_s (the
+# protocol hold time) and by the cross-map gate (MIN_DURATION_REL, group stage).
+QC_THRESHOLDS = {}
+
+# Hold resampling onto the common time grid: 'linear', 'block_mean', 'polyphase' or 'log'
+# (see hold_resampling.py). 'linear' reproduces the original np.interp behaviour.
+RESAMPLE_METHOD = 'block_mean'
+N_POINTS = 200
+
+# Multi-node runs: 'i/N' processes every N-th file of the sorted list starting at i and
+# writes its component accumulators to out_dir/partials (combine with shard_merge.py).
+SHARD = None
+
+# Read the '<column>_filtered' channels added to the cached stores by the filter stage
+# (map_filtering.py, same cache_dir) for the averages and QC instead of the raw ones
+USE_FILTERED = False
+
+# Also export every selected raw hold trace (unaveraged) to out_dir/hold_traces (see hold_traces.py)
+EXPORT_TRACES = False
 
 
 # Segment names (no resampling/normalization; we only use HOLD)
@@ -50,193 +81,153 @@ def rgb_red_mask(mask_img: np.ndarray) -> np.ndarray:
     return np.zeros(mask_img.shape[:2], dtype=bool)
 
 
-def file_group_from_name(name: str) -> str:
-    # kept for potential future use; not used in this script version
-    s = name.lower()
-    cond = 'ctrl' if 'ctrl' in s else ('bleb' if 'bleb' in s else 'unknown')
-    dish = 'dish1' if 'dish1' in s else ('dish2' if 'dish2' in s else 'unknown')
-    return f'{cond}-{dish}'
-
-
-def curve_grid_xy(i: int, curve, n_x: int, n_y: int) -> Tuple[int, int]:
-    md = getattr(curve, 'metadata', {}) or {}
-    gx = md.get('grid index x')
-    gy = md.get('grid index y')
-    if gx is None or gy is None:
-        gy = i // n_x
-        gx = i % n_x
-    return int(gx), int(gy)
+def collect_component_holds(path: str, qc_out_dir: str | None = None, trace_writer: HoldTraceWriter | None = None,
+                            channel: str | None = None) -> Dict[int, List[Tuple[np.ndarray, np.ndarray]]] | None:
+    """Decode one map and return component id -> list of (time_from_start_s, value) hold curves.
 
-
-# No resampling: keep original time axis per curve
-
-
-def find_time_column(df: pd.DataFrame) -> str | None:
-    """Heuristically find a time column in seconds in curve DataFrame."""
-    candidates = [
-        'time (s)', 'Time (s)', 'time_s', 'timestamp (s)', 'timestamp_s', 'time'
-    ]
-    cols_lower = {c.lower(): c for c in df.columns}
-    for cand in candidates:
-        lc = cand.lower()
-        if lc in cols_lower:
-            return cols_lower[lc]
-    # fuzzy: any column containing 'time'
-    for c in df.columns:
-        if 'time' in c.lower():
-            return c
-    return None
-
-
-def process_file(path: str) -> None:
+    value is the hold channel (HOLD_CHANNEL unless given) in its output unit,
+    e.g. height in µm or force in nN. Curves outside the mask or rejected by QC
+    are left out; QC outputs are written to qc_out_dir when given, and the
+    selected raw traces (SI units) are appended to trace_writer. Returns None
+    (after printing why) when the file cannot be used.
+    """
+    channel = channel or HOLD_CHANNEL
+    column, _si_unit, _unit, scale, clamp = HOLD_CHANNELS[channel]
     base = os.path.splitext(os.path.basename(path))[0]
     mask_path = find_mask_for(base)
     if mask_path is None:
         print(f'Skip {base}: mask not found')
-        return
+        return None
 
     try:
-        group = af.AFMGroup(path)
+        store = load_curve_store_cached(path, cache_dir)
     except Exception as e:
         print(f'Skip {base}: cannot open ({e})')
-        return
+        return None
+    try:
+        column = channel_column(store.columns, column, USE_FILTERED)
+    except KeyError as e:
+        print(f'Skip {base}: {e}')
+        return None
 
-    md0 = group[0].metadata
-    n_x = int(md0['grid shape x'])
-    n_y = int(md0['grid shape y'])
+    n_x = store.n_x
+    n_y = store.n_y
+
+    from skimage import io as skio
+    from skimage.measure import label as cc_label
 
     try:
         mask_img = skio.imread(mask_path)
     except Exception as e:
         print(f'Skip {base}: cannot read mask ({e})')
-        return
+        return None
 
     mask2d = rgb_red_mask(mask_img)
     if mask2d.shape != (n_y, n_x):
         print(f'Skip {base}: mask shape {mask2d.shape} != grid shape {(n_y, n_x)}')
-        return
+        return None
 
     # Connected components (cells) from mask
     labels = cc_label(mask2d.astype(np.uint8), connectivity=1)
     n_components = labels.max()
     if n_components == 0:
         print(f'Skip {base}: mask has no connected components')
-        return
+        return None
+
+    # Component id per curve (0 = outside mask or outside grid)
+    gx, gy = store.grid_x, store.grid_y
+    in_grid = (gx >= 0) & (gx < n_x) & (gy >= 0) & (gy < n_y)
+    curve_comp = np.zeros(store.n_curves, dtype=int)
+    curve_comp[in_grid] = labels[gy[in_grid], gx[in_grid]]
+    selected = curve_comp > 0
+
+    # Clamp-quality QC over all curves; rejected curves never enter the averages
+    qc = flag_curves(compute_curve_qc(store, filtered=USE_FILTERED), QC_THRESHOLDS, selected=selected, clamp=clamp)
+    if qc_out_dir:
+        save_qc_outputs(qc, store, qc_out_dir, selected=selected)
+    use = selected & ~qc['rejected'].to_numpy()
 
     """
     We will build, for each connected component, a list of raw hold-segment curves as
-    (time_from_start_s, height_um). Later we'll interpolate onto a common time grid
+    (time_from_start_s, value). Later we'll interpolate onto a common time grid
     to produce a per-component mean±std in time units. Only the averaged CSV+PNG are saved.
     """
-    comp_hold_times_raw: Dict[int, List[np.ndarray]] = {comp_id: [] for comp_id in range(1, n_components + 1)}
-    comp_hold_heights_um_raw: Dict[int, List[np.ndarray]] = {comp_id: [] for comp_id in range(1, n_components + 1)}
+    comp_holds: Dict[int, List[Tuple[np.ndarray, np.ndarray]]] = {comp_id: [] for comp_id in range(1, n_components + 1)}
 
-    for i, curve in enumerate(group):
-        gx, gy = curve_grid_xy(i, curve, n_x, n_y)
-        if gx < 0 or gx >= n_x or gy < 0 or gy >= n_y:
-            continue
-        comp_id = int(labels[gy, gx])
-        if comp_id == 0:
+    idx_use = np.flatnonzero(use)
+    for i, (t, v) in zip(idx_use, extract_segments(store, column, idx_use, segment=1)):
+        if t.size < 2:
             continue
+        comp_holds[int(curve_comp[i])].append((t, v * scale))
+        if trace_writer is not None:
+            trace_writer.add(t, v, file=base, grid_x=int(gx[i]), grid_y=int(gy[i]), component_id=int(curve_comp[i]),
+                             group=file_group_from_name(base), spring_constant=float(store.spring_constant[i]))
+    return comp_holds
+
+
+def save_component_average(base_out_dir: str, base: str, comp_id: int, t_grid: np.ndarray,
+                           mean: np.ndarray, std: np.ndarray, n_curves: int, channel: str | None = None) -> None:
+    """Write the per-component hold average CSV and PNG (e.g. height_um_mean/_std columns)."""
+    plt = pyplot()
+    channel = channel or HOLD_CHANNEL
+    unit = HOLD_CHANNELS[channel][2]
+    n_points = t_grid.size
+    df_out = pd.DataFrame({
+        'file': [base] * n_points,
+        'component_id': [comp_id] * n_points,
+        'time_s': t_grid,
+        hold_value_column(channel, 'mean'): mean,
+        hold_value_column(channel, 'std'): std,
+        'n_curves': [n_curves] * n_points,
+    })
+    csv_path = os.path.join(base_out_dir, f'{base}_comp{comp_id:03d}_hold_avg_time.csv')
+    df_out.to_csv(csv_path, index=False)
+
+    fig, ax = plt.subplots(figsize=(6, 4), dpi=150)
+    ax.plot(t_grid, mean, color='k', label='mean')
+    ax.fill_between(t_grid, mean - std, mean + std, color='k', alpha=0.15, linewidth=0)
+    ax.set_title(f'{base} — comp {comp_id} — hold (n={n_curves})')
+    ax.set_xlabel('time (s)')
+    ax.set_ylabel(f'{channel} ({UNIT_LABELS[unit]})')
+    fig.tight_layout()
+    png_path = os.path.join(base_out_dir, f'{base}_comp{comp_id:03d}_hold_avg_time.png')
+    fig.savefig(png_path, dpi=150)
+    plt.close(fig)
+    print(f'Saved: {csv_path} and {png_path}')
+
+
+def process_file(path: str, trace_writer: HoldTraceWriter | None = None) -> List[Dict]:
+    """Write per-component averages for one map; returns their accumulator records."""
+    base = os.path.splitext(os.path.basename(path))[0]
+    base_out_dir = os.path.join(out_dir, base)
+    comp_holds = collect_component_holds(path, qc_out_dir=base_out_dir, trace_writer=trace_writer)
+    if comp_holds is None:
+        return []
 
-        # Build DataFrame for the curve
-        df = pd.DataFrame()
-        for col in curve.columns:
-            df[col] = curve[col]
-
-        seg = df['segment']
-        h = df['height (measured)']
-
-        # Only process HOLD segment (s == 1). No resampling.
-        seg_mask = (seg == 1).to_numpy() if hasattr(seg, 'to_numpy') else (np.asarray(seg) == 1)
-        idxs = np.flatnonzero(seg_mask)
-        if idxs.size >= 2:
-            t_col = find_time_column(df)
-            if t_col is not None:
-                try:
-                    t = np.asarray(df[t_col], dtype=float)
-                    # Save ORIGINAL time and height arrays for this curve's HOLD segment
-                    time_orig = t[idxs]
-                    height_um = np.asarray(h, dtype=float)[idxs] * 1e6
-                    if time_orig.size >= 2 and height_um.size == time_orig.size:
-                        # shift time to start at 0 for this curve
-                        t0 = float(time_orig[0])
-                        comp_hold_times_raw[comp_id].append(time_orig - t0)
-                        comp_hold_heights_um_raw[comp_id].append(height_um)
-                except Exception:
-                    pass
     # Output per-component HOLD average curves (time domain): save CSV and plot
-    base_out_dir = os.path.join(out_dir, base)
     os.makedirs(base_out_dir, exist_ok=True)
 
-    components_with_data = 0
-    for comp_id in range(1, n_components + 1):
+    records: List[Dict] = []
+    for comp_id, holds in comp_holds.items():
         # Build averaged curve if we have any raw curves
-        t_list = comp_hold_times_raw.get(comp_id, [])
-        y_list = comp_hold_heights_um_raw.get(comp_id, [])
-        if not t_list or not y_list:
+        if not holds:
             continue
 
-        # Determine common time domain: 0 .. min(max time among curves)
-        try:
-            t_max_common = min(float(np.max(t)) for t in t_list if t.size > 1)
-        except ValueError:
-            t_max_common = 0.0
-        if not np.isfinite(t_max_common) or t_max_common <= 0:
-            continue
-        # Simple uniform grid in seconds
-        n_points = 200
-        t_grid = np.linspace(0.0, t_max_common, n_points)
-
-        mats: List[np.ndarray] = []
-        for t, y in zip(t_list, y_list):
-            if t.size < 2 or y.size != t.size:
-                continue
-            msk = np.isfinite(t) & np.isfinite(y)
-            t2 = t[msk]
-            y2 = y[msk]
-            if t2.size < 2:
-                continue
-            try:
-                y_grid = np.interp(t_grid, t2, y2)
-                mats.append(y_grid)
-            except Exception:
-                continue
-        if not mats:
+        # Common time domain 0 .. min(max time among curves), resampled in one batch
+        t_grid, A = resample_curves(holds, n_points=N_POINTS, method=RESAMPLE_METHOD)
+        if A.size == 0:
             continue
-        A = np.vstack(mats)
-        mean_um = np.nanmean(A, axis=0)
-        std_um = np.nanstd(A, axis=0)
+        # Mean/std via (sum, sumsq, count) so sharded and merged runs match exactly
+        s, ss, n = accumulate(A)
+        mean, std = mean_std(s, ss, n)
         n_curves = A.shape[0]
+        save_component_average(base_out_dir, base, comp_id, t_grid, mean, std, n_curves)
+        records.append({'file': base, 'component_id': comp_id, 'group': file_group_from_name(base),
+                        'n_curves': n_curves, 't_grid': t_grid, 'sum': s, 'sumsq': ss, 'count': n})
 
-        # Save CSV and PNG
-        df_out = pd.DataFrame({
-            'file': [base] * n_points,
-            'component_id': [comp_id] * n_points,
-            'time_s': t_grid,
-            'height_um_mean': mean_um,
-            'height_um_std': std_um,
-            'n_curves': [n_curves] * n_points,
-        })
-        csv_path = os.path.join(base_out_dir, f'{base}_comp{comp_id:03d}_hold_avg_time.csv')
-        df_out.to_csv(csv_path, index=False)
-
-        fig, ax = plt.subplots(figsize=(6, 4), dpi=150)
-        ax.plot(t_grid, mean_um, color='k', label='mean')
-        ax.fill_between(t_grid, mean_um - std_um, mean_um + std_um, color='k', alpha=0.15, linewidth=0)
-        ax.set_title(f'{base} — comp {comp_id} — hold (n={n_curves})')
-        ax.set_xlabel('time (s)')
-        ax.set_ylabel('height (µm)')
-        fig.tight_layout()
-        png_path = os.path.join(base_out_dir, f'{base}_comp{comp_id:03d}_hold_avg_time.png')
-        fig.savefig(png_path, dpi=150)
-        plt.close(fig)
-        print(f'Saved: {csv_path} and {png_path}')
-        components_with_data += 1
-
-    if components_with_data == 0:
+    if not records:
         print(f'Skip {base}: no curves selected by components in mask')
-        return
+    return records
 
 
 def main():
@@ -245,9 +236,31 @@ def main():
         print(f'No files found in {folder} matching {pattern}')
         return
 
-    # Process each file independently, generating per-component outputs
-    for path in files:
-        process_file(path)
+    shard_index, shard_count = parse_shard(SHARD)
+    run_files = files
+    files = shard_files(files, shard_index, shard_count)
+
+    trace_writer = nullcontext()
+    if EXPORT_TRACES:
+        # One trace store per shard so concurrent shards never share a file
+        name = 'hold_traces' if not SHARD else f'hold_traces-{shard_index:04d}of{shard_count:04d}'
+        column, si_unit = HOLD_CHANNELS[HOLD_CHANNEL][:2]
+        trace_writer = HoldTraceWriter(os.path.join(out_dir, name), channel=column, unit=si_unit)
+
+    # Process each file independently, generating per-component outputs; the trace
+    # store is published only if every file went through (discarded on an exception)
+    records: List[Dict] = []
+    with trace_writer as writer:
+        for path in files:
+            records.extend(process_file(path, trace_writer=writer))
+    if writer is not None:
+        print(f'Saved: {writer.directory} ({writer.n_traces} hold traces)')
+
+    if SHARD:
+        p = partial_path(out_dir, shard_index, shard_count)
+        save_partial(p, records, files, shard_index, shard_count, run_files,
+                     channel=HOLD_CHANNEL, unit=HOLD_CHANNELS[HOLD_CHANNEL][2])
+        print(f'Saved: {p} (shard {shard_index}/{shard_count}, {len(files)} files, {len(records)} components)')
 
 
 if __name__ == '__main__':
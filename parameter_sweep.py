@@ -0,0 +1,189 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import masked_height_curves as mhc
+from afm_common import file_group_from_name
+from component_hold_steepness_boxplot import welch_ctrl_vs_bleb, welch_pairwise
+from hold_metrics import stack_curves, tail_slopes
+from hold_resampling import resample_curves
+
+"""
+Robustness sweep of the hold-steepness result over analysis settings.
+
+Maps are decoded and hold segments extracted once (masked_height_curves
+selection and QC); every combination in SWEEP is then evaluated on the
+in-memory holds in parallel: component average on the grid (once per
+N_POINTS/RESAMPLE_METHOD pair) -> normalization -> tail slope -> Welch
+tests. Writes one tidy slopes table and one p-value table with a row per
+setting and comparison.
+"""
+
+# Minimal configuration (map/mask selection comes from masked_height_curves settings)
+folder = '/data/2025-09-05'
+pattern = '*.jpk-force-map'
+out_dir = '/data/2025-09-05_sweep'
+
+# Settings grid; every combination is evaluated
+SWEEP = {
+    'TAIL_FRACTION': [0.5, 0.6, 0.7, 0.8, 0.9],
+    'N_POINTS': [100, 200, 400],
+    'NORMALIZATION': ['none', 'divide', 'subtract'],
+    'RESAMPLE_METHOD': ['block_mean'],
+}
+# Worker processes; None = os.cpu_count(), 1 = run in-process
+N_JOBS = None
+
+# component records: (file, group, component_id, holds)
+Record = Tuple[str, str, int, List[Tuple[np.ndarray, np.ndarray]]]
+
+_RECORDS: List[Record] = []
+
+
+def load_records(files: List[str]) -> List[Record]:
+    """Decode every map once and keep the selected hold curves per component."""
+    records: List[Record] = []
+    for path in files:
+        base = os.path.splitext(os.path.basename(path))[0]
+        comp_holds = mhc.collect_component_holds(path)
+        if comp_holds is None:
+            continue
+        group = file_group_from_name(base)
+        for comp_id, holds in comp_holds.items():
+            if holds:
+                records.append((base, group, int(comp_id), holds))
+    return records
+
+
+def normalize(y: np.ndarray, method: str) -> np.ndarray | None:
+    """Same per-curve normalization as compute_group_stats in group_component_curves.py."""
+    if method == 'none':
+        return y
+    m = np.nanmean(y)
+    if not np.isfinite(m):
+        return None
+    if method == 'divide':
+        return None if np.isclose(m, 0.0) else y / m
+    if method == 'subtract':
+        return y - m
+    raise ValueError(f'Unknown normalization {method!r}')
+
+
+def component_averages(records: List[Record], n_points: int, method: str) -> List[Tuple[Dict, np.ndarray, np.ndarray]]:
+    """(row info, t_grid, mean curve) per component for one resampling setting."""
+    out: List[Tuple[Dict, np.ndarray, np.ndarray]] = []
+    for base, group, comp_id, holds in records:
+        t_grid, A = resample_curves(holds, n_points=int(n_points), method=method)
+        if A.size == 0:
+            continue
+        out.append(({'file': base, 'component_id': comp_id, 'group': group, 'n_curves': A.shape[0]},
+                    t_grid, np.nanmean(A, axis=0)))
+    return out
+
+
+def evaluate_setting(records: List[Record], setting: Dict,
+                     averages: List[Tuple[Dict, np.ndarray, np.ndarray]] | None = None) -> Tuple[List[Dict], List[Dict]]:
+    """Slopes (one row per component) and p-values (one row per comparison) for one setting.
+
+    averages: component_averages() for the setting's N_POINTS/RESAMPLE_METHOD, when already computed.
+    """
+    if averages is None:
+        averages = component_averages(records, setting['N_POINTS'], setting['RESAMPLE_METHOD'])
+    curves: List[Tuple[np.ndarray, np.ndarray]] = []
+    rows: List[Dict] = []
+    for info, t_grid, mean in averages:
+        y = normalize(mean, setting['NORMALIZATION'])
+        if y is None:
+            continue
+        curves.append((t_grid, y))
+        rows.append({**setting, **info})
+    # Tail slopes of all component averages in one batch
+    slope = tail_slopes(*stack_curves(curves), frac=float(setting['TAIL_FRACTION']))
+    slopes = [dict(row, slope_per_s=float(s)) for row, s in zip(rows, slope) if np.isfinite(s)]
+
+    pvalues: List[Dict] = []
+    if slopes:
+        df = pd.DataFrame(slopes)
+        for r in welch_pairwise(df, value_col='slope_per_s'):
+            pvalues.append({**setting, 'comparison': f"{r['group1']}_vs_{r['group2']}", 'n1': r['n1'], 'n2': r['n2'],
+                            'diff_mean_per_s': r['diff_mean_per_s'], 'pvalue_welch': r['pvalue_welch']})
+        mixed = welch_ctrl_vs_bleb(df, value_col='slope_per_s')
+        if mixed is not None:
+            pvalues.append({**setting, 'comparison': mixed['comparison'], 'n1': mixed['n_ctrl'], 'n2': mixed['n_bleb'],
+                            'diff_mean_per_s': mixed['diff_mean_per_s'], 'pvalue_welch': mixed['pvalue_welch']})
+    return slopes, pvalues
+
+
+def evaluate_resampling(records: List[Record], settings: List[Dict]) -> List[Tuple[List[Dict], List[Dict]]]:
+    """Settings sharing N_POINTS and RESAMPLE_METHOD: resample once, evaluate each."""
+    averages = component_averages(records, settings[0]['N_POINTS'], settings[0]['RESAMPLE_METHOD'])
+    return [evaluate_setting(records, s, averages) for s in settings]
+
+
+def _init_worker(records: List[Record]) -> None:
+    global _RECORDS
+    _RECORDS = records
+
+
+def _evaluate_in_worker(settings: List[Dict]) -> List[Tuple[List[Dict], List[Dict]]]:
+    return evaluate_resampling(_RECORDS, settings)
+
+
+def sweep_settings(sweep: Dict[str, List]) -> List[Dict]:
+    keys = list(sweep)
+    return [dict(zip(keys, values)) for values in itertools.product(*(sweep[k] for k in keys))]
+
+
+def run_sweep(records: List[Record], settings: List[Dict], n_jobs: int | None = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    n_jobs = n_jobs or os.cpu_count() or 1
+    # One task per resampling (N_POINTS, RESAMPLE_METHOD); tail fraction and
+    # normalization only change the cheap steps after it
+    tasks: Dict[Tuple, List[int]] = {}
+    for k, s in enumerate(settings):
+        tasks.setdefault((s['N_POINTS'], s['RESAMPLE_METHOD']), []).append(k)
+    batches = [[settings[k] for k in idx] for idx in tasks.values()]
+    if n_jobs == 1 or len(batches) <= 1:
+        batch_results = [evaluate_resampling(records, b) for b in batches]
+    else:
+        # Records are shipped once per worker, not once per task
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(records,)) as ex:
+            batch_results = list(ex.map(_evaluate_in_worker, batches))
+    results: List = [None] * len(settings)
+    for idx, res in zip(tasks.values(), batch_results):
+        for k, r in zip(idx, res):
+            results[k] = r
+    slopes = [row for s, _p in results for row in s]
+    pvalues = [row for _s, p in results for row in p]
+    return pd.DataFrame(slopes), pd.DataFrame(pvalues)
+
+
+def main():
+    files = sorted(glob(os.path.join(folder, pattern)))
+    if not files:
+        print(f'No files found in {folder} matching {pattern}')
+        return
+
+    records = load_records(files)
+    if not records:
+        print('No component hold curves selected; nothing to sweep')
+        return
+    settings = sweep_settings(SWEEP)
+    print(f'Sweeping {len(settings)} settings over {len(records)} components from {len(files)} files')
+    slopes_df, pvalues_df = run_sweep(records, settings, n_jobs=N_JOBS)
+
+    os.makedirs(out_dir, exist_ok=True)
+    slopes_csv = os.path.join(out_dir, 'sweep_slopes.csv')
+    slopes_df.to_csv(slopes_csv, index=False)
+    print(f'Saved: {slopes_csv}')
+    pvalues_csv = os.path.join(out_dir, 'sweep_pvalues.csv')
+    pvalues_df.to_csv(pvalues_csv, index=False)
+    print(f'Saved: {pvalues_csv}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,38 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import afmformats as af
 import seaborn as sns
 import pandas as pd
-from scipy.ndimage import gaussian_filter1d
+
+from curve_store import channel_column, load_curve_store_cached
+from map_filtering import filter_store
 
 file_name = 'PC-3-2029-bleb-25-dish1-data-2025.09.05-10.47.17.093.jpk-force-map'
 ind = 45
 SEG_NAMES = {0: "approach", 1: "hold", 2: "retract"}
+# Curve store cache shared with the filter stage (map_filtering.py); None = decode without caching
+cache_dir = '/data/2025-09-05_stores'
 
 
 
-afm_group = af.AFMGroup(file_name)
-
+store = load_curve_store_cached(file_name, cache_dir)
+n_x = store.n_x
+n_y = store.n_y
+spring_constant = store.spring_constant[ind]
 
-metadata = afm_group[0].metadata
-n_x = metadata['grid shape x']
-n_y = metadata['grid shape y']
-spring_constant = metadata['spring constant']
-light_lever_sensitivity = metadata['sensitivity']
-invOLS = 1 / light_lever_sensitivity
+# force_filtered as written by the filter stage; filter the map here if it has not run
+if channel_column(store.columns, 'force', filtered=True, required=False) == 'force':
+    filter_store(store, columns=('force',), n_chunks=1)
 
-curve = afm_group[ind]
-# curve.columns = ['force', 'height (measured)', 'height (piezo)', 'segment', 'time']
+curve = store.curve(ind)
+# curve.keys() = ['force', 'height (measured)', 'height (piezo)', 'segment', 'time', 'force_filtered', ...]
 
 df = pd.DataFrame()
-for col in curve.columns:
-    df[col] = curve[col]
+for col, values in curve.items():
+    df[col] = np.asarray(values)
 
 
 
-df['segment'] = [SEG_NAMES[x] for x in df['segment']]
+df['segment'] = [SEG_NAMES[int(x)] for x in df['segment']]
 
 
 
@@ -41,9 +43,6 @@ df['deflection'] = df['force'] / spring_constant
 #  height (measured) = height (piezo) - deflection
 
 
-df['force_filtered'] = gaussian_filter1d(df['force'], sigma=50)
-
-
 
 #sns.lineplot(df, x='time', y='force', hue='segment', palette='tab10')
 #plt.show()
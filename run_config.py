@@ -0,0 +1,211 @@
+import ast
+import copy
+import hashlib
+import importlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+"""
+Config-driven runs of the batch scripts.
+
+A config file (TOML or YAML) has one section per stage plus an optional
+[common] section. Keys are the module-level names of the stage's script
+(folder, out_dir, TAIL_FRACTION, N_POINTS, ...) and are set on the module
+before its main() runs, so the scripts keep working unchanged when run
+directly.
+
+    [common]
+    folder = '/data/2025-09-05'
+
+    [curves]
+    masks_dir = '/data/2025-09-05/masky'
+    out_dir = '/data/2025-09-05_curves'
+    RESAMPLE_METHOD = 'log'
+
+    [steepness]
+    TAIL_FRACTION = 0.7
+
+Output directories are namespaced by a hash of the stage's resolved settings
+(module defaults overlaid with the config) and of its upstream stages
+(out_dir/cfg-<hash>), so concurrent sweeps never write to the same place, a
+changed default in a script gets a fresh directory, and a downstream stage
+finds exactly the upstream outputs made with matching settings.
+"""
+
+# stage -> (module, output dir attributes, {input dir attribute: upstream stage})
+STAGES: Dict[str, Tuple[str, Tuple[str, ...], Dict[str, str]]] = {
+    'setpoint': ('batch_setpoint_colormap', ('out_dir',), {}),
+    'curves': ('masked_height_curves', ('out_dir',), {}),
+    'group': ('group_component_curves', ('plots_dir',), {'curves_dir': 'curves'}),
+    'steepness': ('component_hold_steepness_boxplot', ('plots_dir',), {'curves_dir': 'curves'}),
+    'sweep': ('parameter_sweep', ('out_dir',), {}),
+    'browse': ('curve_browser', (), {}),
+    'merge': ('shard_merge', ('plots_dir',), {'curves_dir': 'curves'}),
+    'elasticity': ('elasticity_map', ('out_dir',), {}),
+    'relaxation': ('hold_relaxation', ('plots_dir',), {'curves_dir': 'curves'}),
+    'filter': ('map_filtering', (), {}),
+}
+
+# Stages whose module settings another stage calls into directly (configured alongside it)
+STAGE_USES: Dict[str, Tuple[str, ...]] = {
+    'sweep': ('curves',),
+    'merge': ('curves', 'group'),
+}
+
+# Library modules whose defaults a stage's results depend on (hashed with the stage)
+SETTING_MODULES: Dict[str, Tuple[str, ...]] = {
+    'curves': ('curve_qc',),
+}
+
+# Stages whose output another stage reads from the shared cache_dir while a setting is on
+# (setting -> upstream stage); the upstream hash is included only then
+CACHE_INPUTS: Dict[str, Dict[str, str]] = {
+    'curves': {'USE_FILTERED': 'filter'},
+    'browse': {'USE_FILTERED': 'filter'},
+}
+
+# Settings that do not change results and are left out of the hash
+UNHASHED_KEYS = ('cache_dir', 'N_JOBS', 'SHARD')
+
+
+def load_config(path: str | None) -> Dict[str, Dict]:
+    if not path:
+        return {}
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.toml':
+        import tomllib
+        with open(path, 'rb') as fh:
+            cfg = tomllib.load(fh)
+    elif ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError as e:
+            raise RuntimeError(f'PyYAML is required to read {path} ({e})')
+        with open(path, encoding='utf-8') as fh:
+            cfg = yaml.safe_load(fh) or {}
+    else:
+        raise ValueError(f'Unknown config format {ext!r}; use .toml, .yaml or .yml')
+    unknown = set(cfg) - set(STAGES) - {'common'}
+    if unknown:
+        raise ValueError(f'Unknown config sections {sorted(unknown)}; expected common or one of {sorted(STAGES)}')
+    return cfg
+
+
+def parse_value(text: str):
+    """CLI override value: Python/JSON literal if it parses, else a plain string."""
+    for parse in (ast.literal_eval, json.loads):
+        try:
+            return parse(text)
+        except (ValueError, SyntaxError):
+            continue
+    return text
+
+
+def apply_overrides(cfg: Dict[str, Dict], overrides: List[str], stage: str) -> Dict[str, Dict]:
+    """Apply KEY=VALUE or section.KEY=VALUE overrides (bare keys go to `stage`)."""
+    cfg = {k: dict(v) for k, v in cfg.items()}
+    for item in overrides or []:
+        if '=' not in item:
+            raise ValueError(f'Override {item!r} is not KEY=VALUE')
+        key, value = item.split('=', 1)
+        section, _, name = key.strip().rpartition('.')
+        section = section or stage
+        if section not in STAGES and section != 'common':
+            raise ValueError(f'Unknown section {section!r} in override {item!r}')
+        cfg.setdefault(section, {})[name] = parse_value(value.strip())
+    return cfg
+
+
+# Plain-value module attributes that count as settings
+SETTING_TYPES = (str, int, float, bool, type(None), list, tuple, dict)
+
+_DEFAULTS: Dict[str, Dict] = {}
+
+
+def module_defaults(module_name: str) -> Dict:
+    """Settings of a module as first imported (before configure_module changes them)."""
+    if module_name not in _DEFAULTS:
+        mod = importlib.import_module(module_name)
+        _DEFAULTS[module_name] = {k: copy.deepcopy(v) for k, v in vars(mod).items()
+                                  if not k.startswith('_') and isinstance(v, SETTING_TYPES)}
+    return _DEFAULTS[module_name]
+
+
+def stage_params(cfg: Dict[str, Dict], stage: str) -> Dict:
+    module_name = STAGES[stage][0]
+    params = {}
+    # common keys only where the stage's module defines them
+    mod = importlib.import_module(module_name)
+    module_defaults(module_name)
+    for k, v in (cfg.get('common') or {}).items():
+        if hasattr(mod, k):
+            params[k] = v
+    params.update(cfg.get(stage) or {})
+    return params
+
+
+def config_hash(cfg: Dict[str, Dict], stage: str) -> str:
+    """Short hash of a stage's resolved settings and, recursively, of its upstream stages."""
+    module_name, outputs, inputs = STAGES[stage]
+    given = stage_params(cfg, stage)
+    resolved = {**module_defaults(module_name), **given}
+    params = {k: v for k, v in resolved.items() if k not in outputs and k not in UNHASHED_KEYS}
+    for attr, upstream in inputs.items():
+        if attr not in given:
+            params[attr] = {'upstream': upstream, 'hash': config_hash(cfg, upstream)}
+    for used in STAGE_USES.get(stage, ()):
+        params[f'uses:{used}'] = config_hash(cfg, used)
+    for lib in SETTING_MODULES.get(stage, ()):
+        params[f'module:{lib}'] = module_defaults(lib)
+    for setting, upstream in CACHE_INPUTS.get(stage, {}).items():
+        if resolved.get(setting):
+            params[f'cache:{upstream}'] = config_hash(cfg, upstream)
+    blob = json.dumps({'stage': stage, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()[:10]
+
+
+def resolve_stage(cfg: Dict[str, Dict], stage: str, namespace: bool = True) -> Dict:
+    """Module attributes to set for `stage`, with namespaced output and upstream dirs."""
+    module_name, outputs, inputs = STAGES[stage]
+    mod = importlib.import_module(module_name)
+    params = stage_params(cfg, stage)
+    unknown = [k for k in params if not hasattr(mod, k)]
+    if unknown:
+        raise ValueError(f'{module_name} has no setting(s) {unknown}')
+    if not namespace:
+        return params
+    h = config_hash(cfg, stage)
+    for attr in outputs:
+        root = params.get(attr, getattr(mod, attr))
+        if root:
+            params[attr] = os.path.join(root, f'cfg-{h}')
+    for attr, upstream in inputs.items():
+        if attr in params:
+            continue
+        up = resolve_stage(cfg, upstream, namespace=True)
+        up_mod = importlib.import_module(STAGES[upstream][0])
+        params[attr] = up.get(STAGES[upstream][1][0], getattr(up_mod, STAGES[upstream][1][0]))
+    return params
+
+
+def configure_module(stage: str, params: Dict):
+    """Set params on the stage's module and return the module."""
+    mod = importlib.import_module(STAGES[stage][0])
+    for k, v in params.items():
+        setattr(mod, k, v)
+    return mod
+
+
+def write_run_record(params: Dict, stage: str, cfg: Dict[str, Dict]) -> None:
+    """Save the resolved config next to the stage outputs for provenance."""
+    for attr in STAGES[stage][1]:
+        d = params.get(attr)
+        if not d:
+            continue
+        os.makedirs(d, exist_ok=True)
+        tmp = os.path.join(d, f'.run_config.json.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump({'stage': stage, 'hash': config_hash(cfg, stage), 'params': params, 'config': cfg},
+                      fh, indent=1, sort_keys=True, default=str)
+        os.replace(tmp, os.path.join(d, 'run_config.json'))
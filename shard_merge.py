@@ -0,0 +1,105 @@
+import os
+from glob import glob
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import group_component_curves as gcc
+import masked_height_curves as mhc
+from hold_accumulators import mean_std, merge_partials
+from hold_metrics import duration_gate
+
+"""
+Merge step for sharded masked_height_curves runs.
+
+Each shard (SHARD = 'i/N', or `afm_run.py curves --shard i/N`) writes its
+component accumulators to <curves out_dir>/partials. This script checks that
+all N shards are present and were split from the current input listing
+(masked_height_curves folder/pattern), rewrites the per-component average CSV/PNG from the
+accumulators (so shards may run with node-local output trees) and produces the
+group outputs of group_component_curves.py from the same values a single-node
+run would read back, plus a per-group summary of curve and component counts.
+
+Local check with processes standing in for nodes:
+
+    for i in 0 1 2; do python afm_run.py curves -c run.toml --shard $i/3 & done; wait
+    python afm_run.py merge -c run.toml
+"""
+
+# Curves output root holding partials/ (a curves stage out_dir)
+curves_dir = '/data/2025-09-05_curves'
+# Output directory for merged group plots/CSVs
+plots_dir = '/data/2025-09-05_group_plots'
+# Rewrite per-component CSV/PNG under curves_dir from the partials
+WRITE_COMPONENTS = True
+
+
+def component_curves(records: List[Dict]) -> Dict[str, List[Tuple[np.ndarray, np.ndarray]]]:
+    """group -> list of (t_s, hold channel mean), in single-node (sorted path) order.
+
+    Applies the same cross-map duration gate as group_component_curves.
+    """
+    durations = np.asarray([float(np.nanmax(r['t_grid']) - np.nanmin(r['t_grid'])) if r['t_grid'].size > 1 else np.nan
+                            for r in records])
+    keep = duration_gate(durations, gcc.MIN_DURATION_REL)
+    gcc.report_short_components(pd.DataFrame({'file': [r['file'] for r in records]}), keep)
+    groups: Dict[str, List[Tuple[np.ndarray, np.ndarray]]] = {}
+    for r, ok in zip(records, keep):
+        mean, _std = mean_std(r['sum'], r['sumsq'], r['count'])
+        if r['t_grid'].size < 2 or not ok:
+            continue
+        groups.setdefault(r['group'], []).append((r['t_grid'], mean))
+    return groups
+
+
+def group_summary(records: List[Dict]) -> pd.DataFrame:
+    rows = {}
+    for r in records:
+        g = rows.setdefault(r['group'], {'group': r['group'], 'n_files': set(), 'n_components': 0, 'n_curves': 0})
+        g['n_files'].add(r['file'])
+        g['n_components'] += 1
+        g['n_curves'] += r['n_curves']
+    out = [dict(g, n_files=len(g['n_files'])) for g in rows.values()]
+    return pd.DataFrame(out).sort_values('group') if out else pd.DataFrame()
+
+
+def main():
+    run_files = sorted(glob(os.path.join(mhc.folder, mhc.pattern)))
+    if not run_files:
+        print(f'No files found in {mhc.folder} matching {mhc.pattern}; checking partials against each other only')
+    try:
+        records = merge_partials(curves_dir, run_files=run_files or None)
+    except ValueError as e:
+        print(f'Cannot merge: {e}')
+        return
+
+    # Hold channel the shards averaged (recorded in the partials)
+    if not records:
+        print(f'No component averages in partials under {curves_dir}')
+        return
+    channel = records[0]['channel']
+
+    if WRITE_COMPONENTS:
+        for r in records:
+            base_out_dir = os.path.join(curves_dir, r['file'])
+            os.makedirs(base_out_dir, exist_ok=True)
+            mean, std = mean_std(r['sum'], r['sumsq'], r['count'])
+            mhc.save_component_average(base_out_dir, r['file'], r['component_id'], r['t_grid'], mean, std, r['n_curves'],
+                                       channel=channel)
+
+    groups = component_curves(records)
+    if not groups:
+        print(f'No component averages in partials under {curves_dir}')
+        return
+    gcc.write_group_outputs(groups, plots_dir, channel)
+
+    summary = group_summary(records)
+    os.makedirs(plots_dir, exist_ok=True)
+    summary_csv = os.path.join(plots_dir, 'merged_group_counts.csv')
+    summary.to_csv(summary_csv, index=False)
+    print(f'Saved: {summary_csv}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+
+from curve_store import CurveStore, cached_store_dir, save_curve_store
+
+"""Synthetic force maps for the tests: cached curve stores plus red-cell masks."""
+
+
+def synthetic_store(name: str, seed: int, n_x: int = 4, n_y: int = 4) -> CurveStore:
+    """Force-clamp map: approach, creeping hold and retract per curve, with a time column."""
+    rng = np.random.default_rng(seed)
+    cols = {'segment': [], 'time': [], 'force': [], 'height (measured)': []}
+    lengths = []
+    for _ in range(n_x * n_y):
+        n_seg = rng.integers(40, 60, size=3)
+        t = np.arange(n_seg.sum()) * 0.01
+        h0 = rng.normal(5e-6, 1e-7)
+        hold_t = np.arange(n_seg[1]) * 0.01
+        cols['segment'].append(np.repeat([0.0, 1.0, 2.0], n_seg))
+        cols['time'].append(t)
+        cols['force'].append(1e-9 * (1.0 + 0.01 * rng.standard_normal(t.size)))
+        cols['height (measured)'].append(np.concatenate((
+            np.linspace(h0 + 1e-6, h0, n_seg[0]),
+            h0 - 2e-7 * (hold_t / hold_t[-1]) ** 0.3 + 1e-9 * rng.standard_normal(n_seg[1]),
+            np.linspace(h0, h0 + 1e-6, n_seg[2]))))
+        lengths.append(t.size)
+    n = n_x * n_y
+    return CurveStore(columns={k: np.concatenate(v) for k, v in cols.items()},
+                      offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                      grid_x=np.arange(n) % n_x, grid_y=np.arange(n) // n_x, n_x=n_x, n_y=n_y,
+                      spring_constant=np.full(n, 0.1), name=name)
+
+
+def make_dataset(root, names):
+    """root/data (source files), root/stores (matching cached stores, no decoding needed), root/masks."""
+    import tifffile
+
+    data, cache, masks = (root / d for d in ('data', 'stores', 'masks'))
+    for d in (data, cache, masks):
+        d.mkdir()
+    mask = np.zeros((4, 4, 3), dtype=np.uint8)
+    mask[0:2, 0:2, 0] = 255
+    mask[2:4, 3, 0] = 255
+    for k, name in enumerate(names):
+        src = data / f'{name}.jpk-force-map'
+        src.write_bytes(b'synthetic')
+        st = os.stat(src)
+        store = synthetic_store(name, seed=k)
+        store.metadata.update({'source': os.path.abspath(src), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+        save_curve_store(store, cached_store_dir(str(src), str(cache)))
+        tifffile.imwrite(masks / f'{name}.tif', mask, photometric='rgb')
+    return root
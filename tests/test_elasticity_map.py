@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+
+import elasticity_map as em
+from curve_store import CurveStore
+
+N_SIDE = 100
+N_SAMPLES = 200
+# Fit budget for a 100x100 map (batched solver: a few seconds at most)
+TIME_BUDGET_S = 5.0
+
+
+def _hertz_map(rng, n_side=N_SIDE, n_samples=N_SAMPLES):
+    """Approach-only map with known E per curve; returns (store, E_true, no_contact, few_points)."""
+    n = n_side * n_side
+    E_true = rng.uniform(1e3, 20e3, n)
+    K = 4.0 / 3.0 * E_true / (1.0 - em.POISSON_RATIO ** 2) * np.sqrt(em.TIP_RADIUS_M)
+    # Piezo travels 2 µm down; contact height varies per curve
+    h = np.broadcast_to(np.linspace(1e-6, -1e-6, n_samples), (n, n_samples))
+    h_contact = rng.uniform(-0.2e-6, 0.2e-6, n)
+    no_contact = np.zeros(n, dtype=bool)
+    no_contact[rng.choice(n, 50, replace=False)] = True
+    few_points = np.zeros(n, dtype=bool)
+    few_points[rng.choice(np.flatnonzero(~no_contact), 50, replace=False)] = True
+    # Contact 4 samples before the end of the approach: fewer than MIN_FIT_POINTS to fit
+    h_contact[few_points] = h[0, -5]
+
+    delta = np.maximum(h_contact[:, None] - h, 0.0)
+    F = K[:, None] * delta ** 1.5 + 2e-12 * rng.standard_normal((n, n_samples)) + 1e-10
+    # Noise-free, so contact is found exactly where it is (or, when flat, never)
+    F[few_points] = K[few_points, None] * delta[few_points] ** 1.5 + 1e-10
+    F[no_contact] = 1e-10
+
+    store = CurveStore(
+        columns={'segment': np.zeros(n * n_samples), 'force': F.ravel(), 'height (measured)': np.array(h).ravel(),
+                 'time': np.tile(np.arange(n_samples) * 1e-3, n)},
+        offsets=np.arange(n + 1, dtype=np.int64) * n_samples,
+        grid_x=np.arange(n) % n_side, grid_y=np.arange(n) // n_side, n_x=n_side, n_y=n_side,
+        spring_constant=np.full(n, 0.1), name='synthetic-hertz')
+    return store, E_true, no_contact, few_points
+
+
+def test_hertz_map_recovers_modulus_within_budget():
+    store, E_true, no_contact, few_points = _hertz_map(np.random.default_rng(0))
+    t0 = time.perf_counter()
+    df = em.fit_hertz_map(store)
+    elapsed = time.perf_counter() - t0
+
+    assert len(df) == store.n_curves
+    E = df['E_Pa'].to_numpy()
+    fitted = ~(no_contact | few_points)
+    rel = np.abs(E[fitted] - E_true[fitted]) / E_true[fitted]
+    assert np.all(np.isfinite(rel))
+    assert np.median(rel) < 1e-2
+    assert np.percentile(rel, 99) < 5e-2
+    assert np.all(df['r2'].to_numpy()[fitted] > 0.99)
+
+    # No contact or too few post-contact points: no modulus
+    assert np.all(np.isnan(E[no_contact | few_points]))
+    assert np.all(np.isnan(df['r2'].to_numpy()[no_contact | few_points]))
+
+    assert elapsed < TIME_BUDGET_S, f'{N_SIDE}x{N_SIDE} map took {elapsed:.2f} s (budget {TIME_BUDGET_S:.1f} s)'
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from hold_resampling import RESAMPLE_METHODS, resample_curves
+
+
+def _old_interp(curves, n_points):
+    """The original masked_height_curves averaging grid: np.interp onto 0 .. min(max t)."""
+    t_max = min(float(np.max(t)) for t, _y in curves if t.size > 1)
+    t_grid = np.linspace(0.0, t_max, n_points)
+    rows = []
+    for t, y in curves:
+        msk = np.isfinite(t) & np.isfinite(y)
+        rows.append(np.interp(t_grid, t[msk], y[msk]))
+    return t_grid, np.vstack(rows)
+
+
+def test_linear_reproduces_original_interp():
+    rng = np.random.default_rng(0)
+    curves = []
+    for n in (120, 300, 75):
+        t = np.sort(rng.uniform(0.0, rng.uniform(8.0, 12.0), n))
+        t[0] = 0.0
+        y = np.cumsum(rng.standard_normal(n))
+        y[5] = np.nan
+        curves.append((t, y))
+    t_grid, A = resample_curves(curves, n_points=200, method='linear')
+    t_ref, A_ref = _old_interp(curves, 200)
+    np.testing.assert_array_equal(t_grid, t_ref)
+    np.testing.assert_array_equal(A, A_ref)
+
+
+def test_block_mean_bins():
+    # 10 samples per bin at t = 0.05, 0.15, ...; y = sample index, so bin k averages 10k .. 10k + 9
+    t = np.arange(100) * 0.1 + 0.05
+    t = np.concatenate(([0.0], t, [10.0]))
+    y = np.concatenate(([0.0], np.arange(100.0), [99.0]))
+    t_grid, A = resample_curves([(t, y)], n_points=10, method='block_mean')
+    np.testing.assert_allclose(t_grid, np.arange(10) + 0.5)
+    expected = np.arange(10) * 10 + 4.5
+    # First bin also holds the t = 0 sample, last bin the t = 10 sample
+    expected[0] = (0.0 + np.arange(10).sum()) / 11
+    expected[-1] = (np.arange(90, 100).sum() + 99.0) / 11
+    np.testing.assert_allclose(A[0], expected)
+
+
+def test_log_bins_mean_and_empty_fallback():
+    t = np.arange(1001) * 0.01
+    y = 2.0 * t
+    t_grid, A = resample_curves([(t, y)], n_points=20, method='log')
+    assert t_grid.size == A.shape[1] == 20
+    assert np.all(np.diff(t_grid) > 0)
+    # y is linear in t: a bin mean equals y at the mean sample time of the bin
+    edges = np.concatenate(([0.0], np.geomspace(0.01, 10.0, 20)))
+    b = np.clip(np.searchsorted(edges, t, side='right') - 1, 0, 19)
+    counts = np.bincount(b, minlength=20)
+    means = np.bincount(b, weights=y, minlength=20)
+    full = counts > 0
+    np.testing.assert_allclose(A[0][full], means[full] / counts[full])
+    # Narrow early bins without samples are interpolated at the bin center
+    assert (~full).any()
+    np.testing.assert_allclose(A[0][~full], 2.0 * t_grid[~full])
+    assert np.all(np.isfinite(A))
+
+
+def test_polyphase_suppresses_tone_above_output_nyquist():
+    # Output: 100 points over 10 s (Nyquist 5 Hz); the dense curve carries a 40 Hz tone
+    t_dense = np.linspace(0.0, 10.0, 10001)
+    t_short = np.linspace(0.0, 10.0, 150)
+    tone = np.sin(2 * np.pi * 40.0 * t_dense)
+    curves = [(t_dense, tone), (t_short, np.zeros_like(t_short))]
+    _t, A_lin = resample_curves(curves, n_points=100, method='linear')
+    t_grid, A = resample_curves(curves, n_points=100, method='polyphase')
+    assert A.shape == (2, 100)
+    inner = slice(5, -5)
+    assert np.std(A[0, inner]) < 0.05
+    assert np.std(A_lin[0, inner]) > 0.5
+    np.testing.assert_allclose(A[1], 0.0, atol=1e-12)
+
+
+@pytest.mark.parametrize('method', RESAMPLE_METHODS)
+def test_empty_input(method):
+    for curves in ([], [(np.array([0.0]), np.array([1.0]))], [(np.array([0.0, 0.0]), np.array([1.0, 2.0]))]):
+        t_grid, A = resample_curves(curves, n_points=50, method=method)
+        assert t_grid.shape == (0,)
+        assert A.shape == (0,)
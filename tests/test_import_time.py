@@ -0,0 +1,11 @@
+import pytest
+
+import import_benchmark
+
+
+@pytest.mark.parametrize('module', import_benchmark.MODULES)
+def test_import_time(module):
+    res = import_benchmark.measure(module)
+    assert not res['heavy'], f"{module} imports {', '.join(res['heavy'])} at import time"
+    assert res['seconds'] <= import_benchmark.IMPORT_BUDGET_S, \
+        f"{module} took {res['seconds']:.2f} s to import (budget {import_benchmark.IMPORT_BUDGET_S:.2f} s)"
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import pytest
+
+import curve_browser
+import map_filtering
+import masked_height_curves as mhc
+from curve_store import cached_store_dir, channel_column, load_curve_store_cached
+from synthetic import make_dataset
+
+NAMES = ['PC-3-bleb-dish1-data-00', 'PC-3-ctrl-dish1-data-00']
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    root = make_dataset(tmp_path, NAMES)
+    monkeypatch.setattr(map_filtering, 'folder', str(root / 'data'))
+    monkeypatch.setattr(map_filtering, 'cache_dir', str(root / 'stores'))
+    monkeypatch.setattr(map_filtering, 'FILTER_PARAMS', {'sigma': 5})
+    monkeypatch.setattr(mhc, 'folder', str(root / 'data'))
+    monkeypatch.setattr(mhc, 'masks_dir', str(root / 'masks'))
+    monkeypatch.setattr(mhc, 'cache_dir', str(root / 'stores'))
+    return root
+
+
+def test_filtered_columns_are_kept_in_the_cache(dataset, monkeypatch):
+    monkeypatch.setattr(map_filtering, 'N_JOBS', 2)
+    src = str(dataset / 'data' / f'{NAMES[0]}.jpk-force-map')
+    raw_file = os.path.join(cached_store_dir(src, map_filtering.cache_dir), 'col_force.npy')
+    raw_mtime = os.stat(raw_file).st_mtime_ns
+    map_filtering.main()
+    store = load_curve_store_cached(src, map_filtering.cache_dir)
+    for col in map_filtering.FILTER_COLUMNS:
+        name = channel_column(store.columns, col, filtered=True)
+        assert name == f'{col}_filtered'
+        # Smoothed columns vary less than the raw ones
+        assert np.std(store.columns[name]) < np.std(store.columns[col])
+    # Raw columns were not rewritten and the cache key still matches (no re-decode)
+    assert os.stat(raw_file).st_mtime_ns == raw_mtime
+    assert store.metadata['mtime_ns'] == os.stat(src).st_mtime_ns
+    assert curve_browser.display_channels(store, filtered=True) == ('force_filtered', 'height (measured)_filtered')
+
+
+def test_curves_stage_reads_filtered_columns(dataset, monkeypatch, capsys):
+    monkeypatch.setattr(mhc, 'USE_FILTERED', True)
+    src = str(dataset / 'data' / f'{NAMES[0]}.jpk-force-map')
+    assert mhc.collect_component_holds(src) is None
+    assert 'run the filter stage' in capsys.readouterr().out
+
+    map_filtering.process_file(src)
+    filtered = mhc.collect_component_holds(src)
+    monkeypatch.setattr(mhc, 'USE_FILTERED', False)
+    raw = mhc.collect_component_holds(src)
+    assert filtered.keys() == raw.keys()
+    (t_f, y_f), (t_r, y_r) = filtered[1][0], raw[1][0]
+    np.testing.assert_array_equal(t_f, t_r)
+    assert not np.array_equal(y_f, y_r)
+    assert np.std(np.diff(y_f)) < np.std(np.diff(y_r))
@@ -0,0 +1,104 @@
+import filecmp
+import os
+import subprocess
+import sys
+
+import pytest
+
+from hold_accumulators import merge_partials
+from synthetic import make_dataset
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_SHARDS = 3
+NAMES = [f'PC-3-{cond}-dish{dish}-data-{k:02d}' for cond in ('bleb', 'ctrl') for dish in (1, 2) for k in range(2)]
+
+# Runs one stage in a fresh interpreter with module settings given as keyword arguments
+_RUN = (
+    'import importlib, sys\n'
+    'mod = importlib.import_module(sys.argv[1])\n'
+    'for kv in sys.argv[2:]:\n'
+    '    k, v = kv.split("=", 1)\n'
+    '    setattr(importlib.import_module(k.split(".")[0]) if "." in k else mod, k.split(".")[-1], eval(v))\n'
+    'mod.main()\n'
+)
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    return make_dataset(tmp_path_factory.mktemp('shards'), NAMES)
+
+
+def _run(module: str, **settings) -> subprocess.Popen:
+    args = [f'{k}={v!r}' for k, v in settings.items()]
+    return subprocess.Popen([sys.executable, '-c', _RUN, module] + args, cwd=REPO,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def _wait(procs) -> None:
+    for p in procs:
+        out, _ = p.communicate()
+        assert p.returncode == 0, out
+
+
+def _csvs(root, suffix='.csv'):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, fs in os.walk(root) for f in fs if f.endswith(suffix))
+
+
+def test_sharded_run_matches_single_node(dataset):
+    curves = {'folder': str(dataset / 'data'), 'masks_dir': str(dataset / 'masks'), 'cache_dir': str(dataset / 'stores')}
+    single_curves, single_plots = str(dataset / 'single_curves'), str(dataset / 'single_plots')
+    shard_curves, shard_plots = str(dataset / 'shard_curves'), str(dataset / 'shard_plots')
+
+    _wait([_run('masked_height_curves', out_dir=single_curves, **curves)])
+    _wait([_run('group_component_curves', curves_dir=single_curves, plots_dir=single_plots)])
+    # Processes standing in for nodes, all running at once
+    _wait([_run('masked_height_curves', out_dir=shard_curves, SHARD=f'{i}/{N_SHARDS}', **curves) for i in range(N_SHARDS)])
+    _wait([_run('shard_merge', curves_dir=shard_curves, plots_dir=shard_plots,
+                **{f'masked_height_curves.{k}': v for k, v in curves.items()})])
+
+    component_csvs = _csvs(single_curves, '_hold_avg_time.csv')
+    assert len(component_csvs) == 2 * len(NAMES)
+    assert _csvs(shard_curves, '_hold_avg_time.csv') == component_csvs
+    group_csvs = _csvs(single_plots)
+    assert group_csvs
+    assert set(group_csvs) <= set(_csvs(shard_plots))
+    for rel in component_csvs:
+        assert filecmp.cmp(os.path.join(single_curves, rel), os.path.join(shard_curves, rel), shallow=False), rel
+    for rel in group_csvs:
+        assert filecmp.cmp(os.path.join(single_plots, rel), os.path.join(shard_plots, rel), shallow=False), rel
+
+    # Partials only merge against the file list they were split from
+    files = sorted(os.listdir(dataset / 'data'))
+    assert len(merge_partials(shard_curves, run_files=files)) == len(component_csvs)
+    with pytest.raises(ValueError, match='different file list'):
+        merge_partials(shard_curves, run_files=files[:-1])
+    with pytest.raises(ValueError, match='different file list'):
+        merge_partials(shard_curves, run_files=files + ['PC-3-bleb-dish1-data-99.jpk-force-map'])
+
+
+def test_downstream_stages_take_the_channel_from_the_outputs(dataset):
+    # Only the curves stage is told to average force; group, steepness and merge read it back
+    curves = {'folder': str(dataset / 'data'), 'masks_dir': str(dataset / 'masks'), 'cache_dir': str(dataset / 'stores'),
+              'HOLD_CHANNEL': 'force'}
+    single_curves, single_plots = str(dataset / 'force_curves'), str(dataset / 'force_plots')
+    shard_curves, shard_plots = str(dataset / 'force_shard_curves'), str(dataset / 'force_shard_plots')
+
+    _wait([_run('masked_height_curves', out_dir=single_curves, **curves)])
+    _wait([_run('group_component_curves', curves_dir=single_curves, plots_dir=single_plots),
+           _run('component_hold_steepness_boxplot', curves_dir=single_curves, plots_dir=single_plots)])
+    _wait([_run('masked_height_curves', out_dir=shard_curves, SHARD=f'{i}/{N_SHARDS}', **curves) for i in range(N_SHARDS)])
+    _wait([_run('shard_merge', curves_dir=shard_curves, plots_dir=shard_plots,
+                **{f'masked_height_curves.{k}': v for k, v in curves.items() if k != 'HOLD_CHANNEL'})])
+
+    component_csvs = _csvs(single_curves, '_hold_avg_time.csv')
+    assert len(component_csvs) == 2 * len(NAMES)
+    group_csvs = _csvs(single_plots)
+    assert any('slope_nN_per_s' in open(os.path.join(single_plots, rel)).readline() for rel in group_csvs)
+    merged = set(_csvs(shard_plots))
+    assert merged
+    for rel in component_csvs:
+        assert 'force_nN_mean' in open(os.path.join(single_curves, rel)).readline()
+        assert filecmp.cmp(os.path.join(single_curves, rel), os.path.join(shard_curves, rel), shallow=False), rel
+    for rel in merged & set(group_csvs):
+        assert filecmp.cmp(os.path.join(single_plots, rel), os.path.join(shard_plots, rel), shallow=False), rel
+    assert {r['channel'] for r in merge_partials(shard_curves)} == {'force'}